@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+
+Copyright © 2014 François Bianco <francois.bianco@skadi.ch>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+See COPYING file for the full license.
+
+Local stand-in of the Producteev API, to benchmark the client offline.
+
+It emulates the endpoints used by producteev.py with generated data:
+paginated task search with total_hits, the export 302 redirection, file
+downloads (with Range) and multipart uploads. Every request is delayed by
+the configured latency.
+
+"""
+
+import argparse
+import random
+import re
+import socket
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from urlparse import urlparse, parse_qsl
+
+import simplejson as json
+
+
+def object_id(prefix, i):
+    """Fake 24 hexadecimal characters id, like the Producteev ones"""
+    return '{0:02x}{1:022x}'.format(prefix, i)
+
+
+class MockData(object):
+    """Generated tasks, projects, labels, users and files
+
+       tasks:     number of tasks
+       padding:   size in bytes of the description of each task
+       file_size: size in bytes of the downloaded files
+    """
+
+    def __init__(self, tasks=1000, padding=200, file_size=1024 * 1024, seed=0):
+        rnd = random.Random(seed)
+        self.network = {'id': object_id(1, 0), 'title': 'Network'}
+        self.users = [{'id': object_id(2, i), 'email': 'user{0}@example.com'.format(i),
+                       'firstname': 'User', 'lastname': str(i)} for i in range(20)]
+        self.labels = [{'id': object_id(3, i), 'title': 'Label {0}'.format(i),
+                        'network': self.network} for i in range(10)]
+        self.projects = [{'id': object_id(4, i), 'title': 'Project {0}'.format(i),
+                          'network': self.network} for i in range(10)]
+        self.tasks = []
+        for i in range(tasks):
+            created = 1400000000 + i * 60
+            self.tasks.append({
+                'id': object_id(5, i),
+                'title': 'Task {0}'.format(i),
+                'description': 'x' * padding,
+                'status': rnd.choice([0, 1]),
+                'priority': rnd.randint(1, 5),
+                'project': rnd.choice(self.projects),
+                'creator': rnd.choice(self.users),
+                'responsibles': rnd.sample(self.users, rnd.randint(0, 2)),
+                'followers': rnd.sample(self.users, rnd.randint(0, 3)),
+                'labels': rnd.sample(self.labels, rnd.randint(0, 3)),
+                'deadline': time.strftime('%Y-%m-%dT%H:%M:%S+0000', time.gmtime(created + 86400 * 7)),
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%S+0000', time.gmtime(created)),
+                'updated_at': time.strftime('%Y-%m-%dT%H:%M:%S+0000', time.gmtime(created + 3600)),
+            })
+        self.file = ''.join(chr(rnd.randint(0, 255)) for i in range(min(file_size, 65536)))
+        self.file_size = file_size
+
+    def file_chunks(self, start=0):
+        """Generator of the content of a downloaded file from start"""
+        position = start
+        while position < self.file_size:
+            offset = position % len(self.file)
+            chunk = self.file[offset:offset + self.file_size - position]
+            position += len(chunk)
+            yield chunk
+
+    def csv(self):
+        lines = ['id,title,status,priority']
+        lines += ['{0},{1},{2},{3}'.format(t['id'], t['title'], t['status'], t['priority'])
+                  for t in self.tasks]
+        return '\r\n'.join(lines) + '\r\n'
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Request handler answering like the Producteev API"""
+
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1 # send headers and body together
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        # Avoid the Nagle / delayed ACK stalls on multi-segments responses
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.lock:
+            self.server.connections.add(self.connection)
+
+    def finish(self):
+        with self.server.lock:
+            self.server.connections.discard(self.connection)
+        BaseHTTPRequestHandler.finish(self)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def send(self, status, obj=None, headers=None, content_type='application/json'):
+        body = '' if obj is None else obj if isinstance(obj, str) else json.dumps(obj)
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        if body:
+            self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        """Read (and drop) the request body by chunks"""
+        length = int(self.headers.get('content-length') or 0)
+        size = 0
+        while size < length:
+            chunk = self.rfile.read(min(65536, length - size))
+            if not chunk:
+                break
+            size += len(chunk)
+        return size
+
+    def handle_request(self):
+        server = self.server
+        data = server.data
+        body_size = self.read_body()
+        if server.latency:
+            time.sleep(server.latency)
+        with server.lock:
+            server.requests += 1
+
+        url = urlparse(self.path)
+        query = dict(parse_qsl(url.query))
+        path = url.path
+        method = self.command
+
+        if 'POST' == method and '/api/tasks/search' == path:
+            page = int(query.get('page', 1))
+            per_page = int(query.get('per_page', 50))
+            tasks = data.tasks[(page - 1) * per_page:page * per_page]
+            return self.send(200, {'tasks': tasks, 'total_hits': len(data.tasks)})
+        if 'POST' == method and '/api/tasks/search/counts' == path:
+            return self.send(200, {'all': len(data.tasks)})
+        if 'POST' == method and '/api/tasks/export' == path:
+            return self.send(302, headers={'Location': '/api/files/{0}?access_token=mock'.format(object_id(6, 0))})
+        if 'POST' == method and path in ('/api/upload/files', '/api/users/me/avatar'):
+            return self.send(201, {'file': {'id': object_id(6, 1), 'size': body_size}})
+
+        m = re.match(r'^/api/files/(\w+)$', path)
+        if m and 'GET' == method:
+            host = self.headers.get('host')
+            url = 'http://{0}/download/{1}.csv'.format(host, m.group(1))
+            return self.send(200, {'file': {'id': m.group(1), 'title': 'export.csv', 'url': url}})
+        m = re.match(r'^/download/(\w+)\.csv$', path)
+        if m:
+            return self.send(200, data.csv(), content_type='text/csv')
+        m = re.match(r'^/download/(\w+)$', path)
+        if m:
+            return self.send_file()
+
+        m = re.match(r'^/api/tasks/([0-9a-f]{24})/notes$', path)
+        if m:
+            file_obj = {'id': object_id(7, int(m.group(1)[-6:], 16)), 'title': 'file.bin',
+                        'url': 'http://{0}/download/{1}'.format(self.headers.get('host'), m.group(1))}
+            return self.send(200, {'notes': [{'id': object_id(8, 0), 'message': 'note', 'files': [file_obj]}]})
+        m = re.match(r'^/api/tasks/([0-9a-f]{24})$', path)
+        if m and 'GET' == method:
+            index = int(m.group(1)[-6:], 16)
+            if index >= len(data.tasks):
+                return self.send(404, {'error': {'code': 404, 'message': 'Not found'}})
+            return self.send(200, {'task': data.tasks[index]})
+        m = re.match(r'^/api/(users|projects|labels)/([0-9a-f]{24})$', path)
+        if m and 'GET' == method:
+            objects = {'users': data.users, 'projects': data.projects, 'labels': data.labels}[m.group(1)]
+            return self.send(200, {m.group(1)[:-1]: objects[int(m.group(2)[-6:], 16) % len(objects)]})
+        if 'GET' == method and '/api/users/me' == path:
+            return self.send(200, {'user': data.users[0]})
+        if method in ('PUT', 'DELETE', 'POST'):
+            return self.send(200 if 'DELETE' != method else 204)
+        return self.send(404, {'error': {'code': 404, 'message': 'Not found'}})
+
+    def send_file(self):
+        data = self.server.data
+        start = 0
+        m = re.match(r'bytes=(\d+)-$', self.headers.get('range') or '')
+        if m:
+            start = min(int(m.group(1)), data.file_size)
+        self.send_response(206 if m else 200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(data.file_size - start))
+        self.end_headers()
+        for chunk in data.file_chunks(start):
+            self.wfile.write(chunk)
+
+    do_GET = do_POST = do_PUT = do_DELETE = handle_request
+
+
+class MockServer(ThreadingMixIn, HTTPServer):
+    """Threaded mock Producteev API server
+
+       Example:
+           server = MockServer(MockData(tasks=10000), latency=0.02)
+           server.start()
+           p = Producteev(api_uri=server.uri)
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, data=None, latency=0, address=('127.0.0.1', 0), verbose=False):
+        HTTPServer.__init__(self, address, MockHandler)
+        self.data = data or MockData()
+        self.latency = latency
+        self.verbose = verbose
+        self.requests = 0
+        self.connections = set()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def uri(self):
+        return 'http://{0}:{1}'.format(*self.server_address)
+
+    def start(self):
+        """Serve in a background thread"""
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the kept-alive connections"""
+        self.shutdown()
+        self.server_close()
+        with self.lock:
+            connections = list(self.connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        time.sleep(0.1) # let the handlers threads end
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mock Producteev API server')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0, help='seconds added to every request')
+    parser.add_argument('--tasks', type=int, default=1000)
+    parser.add_argument('--padding', type=int, default=200, help='bytes of description per task')
+    parser.add_argument('--file-size', type=int, default=1024 * 1024)
+    args = parser.parse_args()
+
+    server = MockServer(MockData(args.tasks, args.padding, args.file_size), args.latency,
+                        ('127.0.0.1', args.port), verbose=True)
+    print 'Mock Producteev API on', server.uri
+    server.serve_forever()
+
+if __name__ == '__main__':
+    main()
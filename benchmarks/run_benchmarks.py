@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+
+Copyright © 2014 François Bianco <francois.bianco@skadi.ch>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+See COPYING file for the full license.
+
+Offline benchmarks of the Producteev client against the mock server.
+
+Each scenario drives the client through the mock server and reports the
+requests per second, the p50/p99 latency of the requests and the peak RSS
+of the process. Every scenario runs in its own process, so its peak RSS is
+not the one of a previous scenario, e.g.:
+
+    python benchmarks/run_benchmarks.py --tasks 5000 --latency 0.02
+
+"""
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import simplejson as json
+
+from producteev import Producteev, HttpPool, AsyncProducteev
+from mock_server import MockServer, MockData
+
+
+class Recorder(object):
+    """Record the latency of every request through the client hooks"""
+
+    def __init__(self):
+        self.latencies = []
+        self.lock = threading.Lock()
+
+    def after_response(self, info):
+        with self.lock:
+            self.latencies.append(info['elapsed'])
+
+    def percentile(self, p):
+        if not self.latencies:
+            return 0
+        latencies = sorted(self.latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100.0))]
+
+
+def peak_rss_mb():
+    """Peak resident set size of the process in MB (ru_maxrss is in KB on Linux)"""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 1024.0 / (1024.0 if sys.platform == 'darwin' else 1)
+
+
+# Scenarios, each one takes the client and the options
+
+def scan(p, args):
+    for task in p.iter_search_tasks(per_page=args.per_page):
+        pass
+
+def scan_prefetch(p, args):
+    for task in p.iter_search_tasks(per_page=args.per_page, prefetch=True):
+        pass
+
+def scan_parallel(p, args):
+    for task in p.iter_search_tasks_parallel(per_page=args.per_page, workers=args.workers):
+        pass
+
+def get_tasks(p, args):
+    task_ids = [task['id'] for task in p.search_tasks(per_page=args.mutations)['tasks']]
+    ap = AsyncProducteev(p, args.workers)
+    try:
+        ap.bulk('get_task', task_ids)
+    finally:
+        ap.close()
+
+def notes_fanout(p, args):
+    for task_id, notes in p.iter_tasks_fanout(p.iter_search_tasks(per_page=args.per_page),
+                                              workers=args.workers):
+        pass
+
+def mutations(p, args):
+    task_ids = [task['id'] for task in p.search_tasks(per_page=args.mutations)['tasks']]
+    for task_id in task_ids:
+        p.add_task_label(task_id, args.label_id)
+
+def mutations_batch(p, args):
+    task_ids = [task['id'] for task in p.search_tasks(per_page=args.mutations)['tasks']]
+    with p.batch(50):
+        for task_id in task_ids:
+            p.add_task_label(task_id, args.label_id)
+
+def upload(p, args):
+    p.upload_file(args.upload_path)
+
+def download(p, args):
+    with open(os.devnull, 'wb') as f:
+        p.download('/download/{0}'.format(args.label_id), f)
+
+def export(p, args):
+    for row in p.iter_export_tasks():
+        pass
+
+SCENARIOS = [scan, scan_prefetch, scan_parallel, get_tasks, notes_fanout, mutations,
+             mutations_batch, upload, download, export]
+
+
+def run_child(scenario, args):
+    """Run the scenario in this process and return its measures"""
+    transport = HttpPool(args.workers) if args.pool else None
+    p = Producteev(api_uri=args.uri, transport=transport, access_token='benchmark')
+    recorder = Recorder()
+    p.add_hook('after_response', recorder.after_response)
+
+    start = time.time()
+    scenario(p, args)
+    elapsed = time.time() - start
+
+    return {
+        'seconds': elapsed,
+        'p50': recorder.percentile(50) * 1000,
+        'p99': recorder.percentile(99) * 1000,
+        'rss': peak_rss_mb(),
+    }
+
+
+def run(scenario, server, args):
+    """Run the scenario in a new process and return its measures"""
+    command = [sys.executable, os.path.abspath(__file__), '--child', scenario.__name__,
+               '--uri', server.uri, '--upload-path', args.upload_path, '--label-id', args.label_id,
+               '--per-page', str(args.per_page), '--workers', str(args.workers),
+               '--mutations', str(args.mutations)]
+    if args.pool:
+        command.append('--pool')
+
+    requests = server.requests
+    r = json.loads(subprocess.check_output(command))
+    requests = server.requests - requests
+
+    r['scenario'] = scenario.__name__
+    r['requests'] = requests
+    r['rps'] = requests / r['seconds'] if r['seconds'] else 0
+    return r
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Producteev client offline')
+    parser.add_argument('scenarios', nargs='*', help='scenarios to run (default all): '
+                        + ', '.join(s.__name__ for s in SCENARIOS))
+    parser.add_argument('--latency', type=float, default=0.01, help='seconds added by the server to every request')
+    parser.add_argument('--tasks', type=int, default=2000)
+    parser.add_argument('--padding', type=int, default=200, help='bytes of description per task')
+    parser.add_argument('--per-page', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--mutations', type=int, default=200)
+    parser.add_argument('--file-size', type=int, default=8 * 1024 * 1024)
+    parser.add_argument('--pool', action='store_true', help='use an HttpPool transport')
+    # Options of the scenario processes
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--uri', help=argparse.SUPPRESS)
+    parser.add_argument('--upload-path', help=argparse.SUPPRESS)
+    parser.add_argument('--label-id', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        scenario = dict((s.__name__, s) for s in SCENARIOS)[args.child]
+        print json.dumps(run_child(scenario, args))
+        return
+
+    scenarios = [s for s in SCENARIOS if not args.scenarios or s.__name__ in args.scenarios]
+    data = MockData(args.tasks, args.padding, args.file_size)
+    args.label_id = data.labels[0]['id']
+    server = MockServer(data, args.latency).start()
+
+    with tempfile.NamedTemporaryFile() as f:
+        for chunk in data.file_chunks():
+            f.write(chunk)
+        f.flush()
+        args.upload_path = f.name
+
+        print '{0:<16} {1:>9} {2:>9} {3:>10} {4:>9} {5:>9} {6:>9}'.format(
+              'scenario', 'requests', 'seconds', 'req/s', 'p50 ms', 'p99 ms', 'RSS MB')
+        for scenario in scenarios:
+            r = run(scenario, server, args)
+            print '{scenario:<16} {requests:>9} {seconds:>9.2f} {rps:>10.1f} {p50:>9.1f} {p99:>9.1f} {rss:>9.1f}'.format(**r)
+
+    server.stop()
+
+if __name__ == '__main__':
+    main()
@@ -7,7 +7,6 @@ Copyright © 2014 François Bianco <francois.bianco@skadi.ch>
 This example can be reuse for any purpose.
 """
 
-import gzip
 from producteev import Producteev
 
 def main():
@@ -16,17 +15,12 @@ def main():
 
 
     criteria={"statuses":[0, 1],} # get active and done tasks
-    file_url = p.export_tasks(criteria)['file']['url']
-    print "→ Downoald exported file", file_url
-    r,c = p.http.request(file_url) # borrow Producteev http
-
-    if r['status'] == '200':
-        with gzip.open('producteev_exported.csv.gz','wb') as f:
-            f.write(c)
-        print 'Saved to producteev_exported.csv.gz'
-    else:
-        print 'Failled'
-        print r, c
+    print "→ Download exported file"
+    # The file is streamed to disk while the rows are read
+    rows = 0
+    for row in p.iter_export_tasks(criteria, gzip_path='producteev_exported.csv.gz'):
+        rows += 1
+    print 'Saved', rows, 'tasks to producteev_exported.csv.gz'
 
 if __name__ == '__main__':
-  main()
\ No newline at end of file
+  main()
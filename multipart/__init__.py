@@ -1,4 +1,5 @@
 import datetime
+import os
 import mimetypes
 import cStringIO
 import StringIO
@@ -46,3 +47,112 @@ def get_headers_and_body(fields={}, files={}):
         'MIME-Version':'1.0',
     }
     return headers, body
+
+def _remaining_size(value):
+    """Number of bytes left to read in the file-like value"""
+    try:
+        return os.fstat(value.fileno()).st_size - value.tell()
+    except (AttributeError, IOError, OSError):
+        pass
+    position = value.tell()
+    value.seek(0, os.SEEK_END)
+    size = value.tell() - position
+    value.seek(position)
+    return size
+
+class MultipartStream(object):
+    """File-like multipart/form-data body which reads the files by chunks
+       only when it is itself read, so they are never loaded in memory.
+
+       len() gives the body size, computed from the files size.
+    """
+
+    def __init__(self, boundary, fields, files):
+        crlf = '\r\n'
+        self.parts = []
+        for key, value in fields.iteritems():
+            self.parts.append(crlf.join([
+                ''.join(['--', boundary]),
+                'Content-Disposition: form-data; name="%s"' % str(key),
+                '',
+                str(value),
+                '']))
+        for key, values in files.iteritems():
+            filename, value = values
+            if not hasattr(value, 'read'):
+                raise ValueError, "Files must be file-like objects"
+            self.parts.append(crlf.join([
+                ''.join(['--', boundary]),
+                'Content-Disposition: form-data; name="%s"; filename="%s"' % (str(key), str(filename)),
+                'Content-Type: %s' % (mimetypes.guess_type(filename)[0] or 'application/octet-stream'),
+                '',
+                '']))
+            self.parts.append((value, value.tell(), _remaining_size(value)))
+            self.parts.append(crlf)
+        self.parts.append(''.join(['--', boundary, '--', crlf]))
+        self.size = sum(len(part) if isinstance(part, str) else part[2] for part in self.parts)
+        self.seek(0)
+
+    def __len__(self):
+        return self.size
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        """Only rewinding to a position previously returned by tell() is
+           supported, to send again the body.
+        """
+        if whence != os.SEEK_SET:
+            raise IOError, "MultipartStream can only seek from start"
+        self.position = 0
+        self.index = 0
+        self.offset = 0
+        for part in self.parts:
+            if not isinstance(part, str):
+                part[0].seek(part[1])
+        while self.position < offset:
+            self.read(min(offset - self.position, 65536))
+
+    def read(self, size=-1):
+        chunks = []
+        while self.index < len(self.parts) and size != 0:
+            part = self.parts[self.index]
+            if isinstance(part, str):
+                end = len(part) if size < 0 else self.offset + size
+                chunk = part[self.offset:end]
+                left = len(part) - self.offset - len(chunk)
+            else:
+                value, start, length = part
+                want = length - self.offset
+                chunk = value.read(want if size < 0 else min(size, want))
+                left = want - len(chunk)
+                if chunk == '' and left:
+                    raise IOError, "File truncated while being uploaded"
+            chunks.append(chunk)
+            self.position += len(chunk)
+            if size > 0:
+                size -= len(chunk)
+            if left:
+                self.offset += len(chunk)
+            else:
+                self.index += 1
+                self.offset = 0
+        return ''.join(chunks)
+
+def get_content_type_and_stream(fields, files={}):
+    """Same as get_content_type_and_body() but the body is a
+       MultipartStream reading the files only when sent.
+    """
+    boundary = '------BOUNDARY-%d'%datetime.datetime.now().microsecond
+    content_type = 'Multipart/form-data; boundary=%s' % boundary
+    return content_type, MultipartStream(boundary, fields, files)
+
+def get_headers_and_stream(fields={}, files={}):
+    content_type, body = get_content_type_and_stream(fields, files)
+    headers = {
+        'Content-Type':content_type,
+        'Content-Length':str(len(body)),
+        'MIME-Version':'1.0',
+    }
+    return headers, body
@@ -22,15 +22,35 @@ See COPYING file for the full license.
 
 """
 
-import argparse
+import contextlib
+import csv
+import datetime
 import gzip
+import httplib
+import random
+import re
+import socket
 import sys
+import threading
+import time
+import zlib
+from collections import deque, OrderedDict
+from multiprocessing.pool import ThreadPool
+from Queue import Queue
 
 import httplib2
+from email.utils import parsedate_tz, mktime_tz
 from urllib import urlencode
+from urlparse import urlparse, urlunparse, urljoin, parse_qsl
 import simplejson as json
 
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+
 from oauth2client.file import Storage
+from oauth2client.client import AccessTokenCredentials
 from oauth2client.client import AccessTokenRefreshError
 from oauth2client.client import OAuth2WebServerFlow
 from oauth2client import tools
@@ -55,6 +75,15 @@ REVOKE_URI = API_URI + '/oauth/v2/revoke' # FIXME not sure if it exists
 
 REDIRECT_URI  = 'http://localhost:8080' # oauth2client serveur
 
+CREDENTIALS_FILE = 'credentials_producteev.dat'
+
+
+"""Events of the request hooks, see Producteev.add_hook()"""
+HOOKS = ('before_request', 'after_response', 'on_error', 'retry', 'cache_hit', 'coalesced')
+
+"""Handling of the 302 redirections, see Producteev.request()"""
+REDIRECTS = ('follow', 'location', 'stream')
+
 
 """Producteev Exceptions"""
 class ProducteevError(Exception): pass
@@ -66,109 +95,1054 @@ class ProducteevNotFound(ProducteevError): pass # HTTP 404
 class ProducteevConflict(ProducteevError): pass # HTTP 409
 class ProducteevInternalServerError(ProducteevError): pass # HTTP 500
 class ProducteevUnknown(ProducteevError): pass
+class ProducteevTooManyRequests(ProducteevUnknown): pass # HTTP 429
+class ProducteevServiceUnavailable(ProducteevUnknown): pass # HTTP 503
+
+
+def raise_for_status(s, c):
+    """Raise the ProducteevError matching the HTTP status s of an error
+       response, c being the response content.
+    """
+    if   400 == s:
+        raise ProducteevBadRequest, c
+    elif 401 == s:
+        raise ProducteevUnauthorized, c
+    elif 403 == s:
+        raise ProducteevAccessDenied, c
+    elif 404 == s:
+        raise ProducteevNotFound, c
+    elif 409 == s:
+        raise ProducteevConflict, c
+    elif 429 == s:
+        raise ProducteevTooManyRequests, c
+    elif 500 == s:
+        raise ProducteevInternalServerError, c
+    elif 503 == s:
+        raise ProducteevServiceUnavailable, c
+    else:
+        raise ProducteevUnknown, c
+
+
+def download_size(r):
+    """Size of the whole file downloaded by the httplib.HTTPResponse r,
+       from its Content-Range (206 and 416 responses) or Content-Length,
+       None if unknown
+    """
+    if r.status in (206, 416):
+        match = re.match(r'bytes (?:\d+-(\d+)|\*)/(\d+)', r.getheader('content-range') or '')
+        if match is None:
+            return None
+        return int(match.group(1)) + 1 if match.group(1) else int(match.group(2))
+    length = r.getheader('content-length')
+    return int(length) if length and length.isdigit() else None
+
+
+def strip_access_token(location):
+    """Return the location without its access_token query parameter
+
+       The Producteev redirections carry the token in the query, and the
+       API answers 500 when it also gets it in the Authorization header.
+    """
+    u = urlparse(location)
+    query = [(k, v) for k, v in parse_qsl(u.query, True) if 'access_token' != k]
+    return urlunparse(u._replace(query=urlencode(query)))
+
+
+def _related_uris(uri, other):
+    """True if the resources at uri and other are the same, or one is a
+       parent of the other
+    """
+    path = uri.split('?')[0].rstrip('/')
+    other = other.split('?')[0].rstrip('/')
+    return path == other or path.startswith(other + '/') or other.startswith(path + '/')
+
+
+def _connection(u, timeout=None):
+    """New httplib connection to the host of the parsed URL u"""
+    if 'https' == u.scheme:
+        return httplib.HTTPSConnection(u.netloc, timeout=timeout)
+    return httplib.HTTPConnection(u.netloc, timeout=timeout)
+
+
+def _http_connection(http, u):
+    """New httplib connection to the host of the parsed URL u, with the
+       timeout, proxy, CA certificates and client certificate of the
+       httplib2.Http object http
+    """
+    proxy_info = http.proxy_info
+    if callable(proxy_info):
+        proxy_info = proxy_info(u.scheme)
+    if proxy_info is not None and not proxy_info.applies_to(u.hostname):
+        proxy_info = None
+    if 'https' != u.scheme:
+        return httplib2.HTTPConnectionWithTimeout(u.netloc, timeout=http.timeout, proxy_info=proxy_info)
+    certs = list(http.certificates.iter(u.netloc)) or [(None, None)]
+    return httplib2.HTTPSConnectionWithTimeout(u.netloc, key_file=certs[0][0], cert_file=certs[0][1],
+               timeout=http.timeout, proxy_info=proxy_info, ca_certs=http.ca_certs,
+               disable_ssl_certificate_validation=http.disable_ssl_certificate_validation)
+
+
+def iter_lines(chunks):
+    """Generator splitting an iterable of strings into lines, line
+       endings included, as expected by the csv module
+    """
+    rest = ''
+    for chunk in chunks:
+        lines = (rest + chunk).splitlines(True)
+        rest = lines.pop() if lines and not lines[-1].endswith('\n') else ''
+        for line in lines:
+            yield line
+    if rest:
+        yield rest
+
+
+class TokenCache(Storage):
+    """Credentials file shared by the threads and the processes
+
+       oauth2client holds the storage lock while it refreshes a token, and
+       first reloads the credentials to use the token refreshed meanwhile by
+       another worker if any. This storage also locks the file (with fcntl,
+       when available), so N workers sharing it do one refresh instead of N.
+    """
+
+    def __init__(self, filename=CREDENTIALS_FILE):
+        Storage.__init__(self, filename)
+        self._lock_file = None
+
+    def acquire_lock(self):
+        Storage.acquire_lock(self)
+        if fcntl is not None:
+            try:
+                self._lock_file = open(self._filename + '.lock', 'a')
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            except Exception:
+                Storage.release_lock(self)
+                raise
+
+    def release_lock(self):
+        try:
+            if self._lock_file is not None:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+                self._lock_file.close()
+                self._lock_file = None
+        finally:
+            Storage.release_lock(self)
+
+
+class _Prefetch(threading.Thread):
+    """Fetch the pages requested with request() in a background thread,
+       get() wait for the next result and re-raise in the caller thread
+       any exception that occured.
+
+       The same thread fetches all the pages of an iterator, so it keeps
+       using the same connection. stop() ends it.
+    """
+
+    def __init__(self, fetch, per_page):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.fetch = fetch
+        self.per_page = per_page
+        self.pages = Queue()
+        self.results = Queue()
+        self.start()
+
+    def run(self):
+        while True:
+            page = self.pages.get()
+            if page is None:
+                return
+            try:
+                self.results.put((self.fetch(page, self.per_page), None))
+            except Exception:
+                self.results.put((None, sys.exc_info()))
+
+    def request(self, page):
+        self.pages.put(page)
+
+    def get(self):
+        result, exc_info = self.results.get()
+        if exc_info is not None:
+            raise exc_info[0], exc_info[1], exc_info[2]
+        return result
+
+    def stop(self):
+        self.pages.put(None)
+
+
+class HttpPool(object):
+    """Thread-safe pool of keep-alive httplib2.Http objects
+
+       The pool can be given as transport to Producteev and be shared by
+       many threads. Each request checks out an Http object, so the
+       connection (and its TLS session) it keeps open is reused by the
+       following requests instead of being negotiated again.
+
+       max_connections: maximum number of Http objects in the pool, a
+                        request wait for one to be checked in when all
+                        of them are in use.
+       max_per_host:    maximum number of concurrent requests to a host,
+                        None for no limit.
+       idle_timeout:    Http objects unused for more seconds are closed.
+       http_kwargs:     keywords arguments given to httplib2.Http()
+    """
+
+    thread_safe = True
+
+    def __init__(self, max_connections=10, max_per_host=None, idle_timeout=60, **http_kwargs):
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.http_kwargs = http_kwargs
+        self._idle = [] # (last used time, http), most recently used last
+        self._size = 0
+        self._cond = threading.Condition()
+        self._hosts = {}
+
+    def _close(self, http):
+        for conn in http.connections.values():
+            conn.close()
+        http.connections.clear()
+
+    def checkout(self):
+        """Return an Http object for the exclusive use of the caller,
+           which must give it back with checkin()
+        """
+        with self._cond:
+            while True:
+                expired = time.time() - self.idle_timeout
+                while self._idle and self._idle[0][0] < expired:
+                    self._close(self._idle.pop(0)[1])
+                    self._size -= 1
+                if self._idle:
+                    return self._idle.pop()[1]
+                if self._size < self.max_connections:
+                    self._size += 1
+                    break
+                self._cond.wait()
+        try:
+            return httplib2.Http(**self.http_kwargs)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def checkin(self, http):
+        with self._cond:
+            self._idle.append((time.time(), http))
+            self._cond.notify()
+
+    def _host_slot(self, uri):
+        host = urlparse(uri).netloc
+        with self._cond:
+            slot = self._hosts.get(host)
+            if slot is None:
+                slot = self._hosts[host] = threading.BoundedSemaphore(self.max_per_host)
+            return slot
+
+    @contextlib.contextmanager
+    def checked_out(self, uri):
+        """Context giving a pooled Http object for a request to uri, within
+           the max_per_host limit
+        """
+        slot = self._host_slot(uri) if self.max_per_host else None
+        if slot is not None:
+            slot.acquire()
+        try:
+            http = self.checkout()
+            try:
+                yield http
+            except Exception:
+                # Do not reuse a connection left in an unknown state
+                self._close(http)
+                raise
+            finally:
+                self.checkin(http)
+        finally:
+            if slot is not None:
+                slot.release()
+
+    def request(self, uri, method='GET', body=None, headers=None,
+                redirections=httplib2.DEFAULT_MAX_REDIRECTS, connection_type=None):
+        """Same as httplib2.Http.request() using a pooled Http object"""
+        with self.checked_out(uri) as http:
+            return http.request(uri, method, body, headers, redirections, connection_type)
+
+    def close(self):
+        """Close all the idle connections"""
+        with self._cond:
+            for last_used, http in self._idle:
+                self._close(http)
+            self._size -= len(self._idle)
+            self._idle = []
+            self._cond.notify_all()
+
+
+class TokenBucket(object):
+    """Client-side rate limiter shared by all the threads of a client
+
+       Allows on average rate requests per second, with bursts of up to
+       burst requests. pause() stops every caller for a while, it is used
+       when the server asks to slow down (HTTP 429 or 503).
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1, rate))
+        self._tokens = self.burst
+        self._last = time.time()
+        self._resume_at = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Wait until a request can be sent"""
+        while True:
+            with self._lock:
+                now = time.time()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if now >= self._resume_at and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._resume_at - now, (1 - self._tokens) / self.rate)
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Hold every request for the given number of seconds"""
+        with self._lock:
+            self._resume_at = max(self._resume_at, time.time() + seconds)
+
+
+class RetryPolicy(object):
+    """When and how long to wait before sending again a failed request
+
+       Requests answered with one of the throttled statuses (429, 503) were
+       not processed and are always retried. The server errors statuses and
+       the connection errors are only retried for the idempotent_methods,
+       since the request may already have been processed.
+
+       The delay follows the Retry-After header if given, or else grows
+       exponentially from backoff up to max_backoff seconds with a random
+       jitter ("full jitter"). The request is not retried when Retry-After
+       asks to wait more than max_retry_after seconds, its error is raised.
+    """
+
+    def __init__(self, max_retries=3, backoff=0.5, max_backoff=60, max_retry_after=300,
+                 throttled_statuses=(429, 503), error_statuses=(500, 502, 504),
+                 idempotent_methods=('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS')):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+        self.throttled_statuses = throttled_statuses
+        self.error_statuses = error_statuses
+        self.idempotent_methods = idempotent_methods
+
+    def retry_status(self, method, status, attempt):
+        if attempt >= self.max_retries:
+            return False
+        if status in self.throttled_statuses:
+            return True
+        return status in self.error_statuses and method in self.idempotent_methods
+
+    def retry_error(self, method, attempt):
+        return attempt < self.max_retries and method in self.idempotent_methods
+
+    def delay(self, attempt, response=None):
+        """Seconds to wait before the attempt+1 retry, None to give up"""
+        retry_after = (response or {}).get('retry-after')
+        delay = None
+        if retry_after:
+            try:
+                delay = max(0, float(retry_after))
+            except ValueError:
+                date = parsedate_tz(retry_after)
+                if date is not None:
+                    delay = max(0, mktime_tz(date) - time.time())
+        if delay is not None:
+            if self.max_retry_after is not None and delay > self.max_retry_after:
+                return None
+            return delay
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+class ResponseCache(object):
+    """LRU cache of the GET responses of the Producteev API
+
+       Give it as cache to Producteev to avoid requesting again read-mostly
+       objects. Only the URIs matching one of the ttls regular expressions
+       are cached, for the associated number of seconds. Once expired, an
+       entry is revalidated with If-None-Match/If-Modified-Since, so a
+       304 Not Modified answer costs no body transfer.
+
+       The entries are kept by scope: Producteev gives its (api_uri,
+       access_token), so a cache shared by several users never answers one
+       with the response sent to another.
+
+       Any other request (PUT, POST, DELETE) on a resource invalidates the
+       cached entries for it and its parents in every scope, e.g.
+       update_project() drops /api/projects/{id} and add_task_label() drops
+       /api/tasks/{id}.
+
+       max_entries: number of responses kept, least recently used first
+                    discarded.
+    """
+
+    TTLS = [
+        (r'^/api/(label_colors|languages|timezones)$', 3600),
+        (r'^/api/users/me$', 60),
+        (r'^/api/(networks|projects|users|labels)/[^/?]+$', 60),
+    ]
+
+    def __init__(self, ttls=TTLS, max_entries=1000):
+        self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in ttls]
+        self.max_entries = max_entries
+        self._entries = OrderedDict() # (scope, uri) -> [expires, response, content]
+        self._lock = threading.Lock()
+
+    def ttl(self, uri):
+        """Return the ttl of uri, or None if it must not be cached"""
+        for pattern, ttl in self.ttls:
+            if pattern.match(uri):
+                return ttl
+        return None
+
+    def get(self, uri, scope=None):
+        """Return (fresh, response, content) for uri in scope or None if not
+           cached
+        """
+        with self._lock:
+            entry = self._entries.pop((scope, uri), None)
+            if entry is None:
+                return None
+            self._entries[(scope, uri)] = entry
+            return entry[0] > time.time(), entry[1], entry[2]
+
+    def conditional_headers(self, response):
+        """Headers revalidating the cached response"""
+        headers = {}
+        if 'etag' in response:
+            headers['If-None-Match'] = response['etag']
+        if 'last-modified' in response:
+            headers['If-Modified-Since'] = response['last-modified']
+        return headers
+
+    def store(self, uri, response, content, scope=None):
+        ttl = self.ttl(uri)
+        if ttl is None:
+            return
+        with self._lock:
+            self._entries.pop((scope, uri), None)
+            self._entries[(scope, uri)] = [time.time() + ttl, response, content]
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, uri):
+        """Drop the cached entries of the resource at uri and its parents"""
+        with self._lock:
+            for key in self._entries.keys():
+                if _related_uris(uri, key[1]):
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SingleFlight(object):
+    """Share a single call between the threads making the same call at once
+
+       The first thread calling do() with a key runs the call, the threads
+       calling do() with the same key meanwhile wait for it and get the
+       same result or error, unless the call was forgotten meanwhile.
+    """
+
+    def __init__(self):
+        self._calls = {} # key -> [done event, result, exc_info]
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, func, *args):
+        """Return (result of func(*args), True if it was called by this
+           thread or False if shared with another call)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = [threading.Event(), None, None]
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        if leader:
+            try:
+                call[1] = func(*args)
+            except:
+                call[2] = sys.exc_info()
+            finally:
+                with self._lock:
+                    if self._calls.get(key) is call:
+                        del self._calls[key]
+                call[0].set()
+        else:
+            call[0].wait()
+        if call[2] is not None:
+            raise call[2][0], call[2][1], call[2][2]
+        return call[1], leader
+
+    def forget(self, match):
+        """Stop sharing the calls in progress whose key matches, so the
+           next do() with their key makes a new call
+        """
+        with self._lock:
+            for key in self._calls.keys():
+                if match(key):
+                    del self._calls[key]
+
+    def stats(self):
+        """Number of calls made and of calls saved"""
+        with self._lock:
+            return {'calls': self.calls, 'coalesced': self.coalesced}
+
+
+def bounded_map(func, iterable, workers=4, ordered=True, pool=None):
+    """Generator calling func(item) for each item of iterable from a pool
+       of worker threads, with at most 2 * workers calls pending at once.
+
+       Yields (item, result, exc_info) tuples, exc_info being None unless
+       the call raised. Results come in the iterable order, or as soon as
+       they are ready if ordered is False.
+
+       pool is an optional ThreadPool to use instead of a new one, it is
+       left running. At most workers calls are then pending at once.
+    """
+    def call(item):
+        try:
+            return item, func(item), None
+        except Exception:
+            return item, None, sys.exc_info()
+
+    own_pool = pool is None
+    window = 2 * workers if own_pool else workers
+    if own_pool:
+        pool = ThreadPool(workers)
+    done = Queue()
+    pending = deque()
+    items = iter(iterable)
+    try:
+        while True:
+            for item in items:
+                if ordered:
+                    pending.append(pool.apply_async(call, (item,)))
+                else:
+                    pending.append(pool.apply_async(call, (item,), callback=done.put))
+                if len(pending) >= window:
+                    break
+            if not pending:
+                break
+            if ordered:
+                yield pending.popleft().get()
+            else:
+                result = done.get()
+                pending.popleft()
+                yield result
+    finally:
+        if own_pool:
+            pool.terminate()
+        else:
+            for result in pending:
+                result.wait()
+
+
+class _AuthorizedHttp(object):
+    """Http-like object sending the requests of the transport of api with
+       its OAuth token, kept as Producteev.http for the code calling
+       http.request() directly.
+    """
+
+    thread_safe = True
+
+    def __init__(self, api):
+        self.api = api
+
+    def request(self, uri, method='GET', body=None, headers=None,
+                redirections=httplib2.DEFAULT_MAX_REDIRECTS, connection_type=None):
+        """Same as httplib2.Http.request(), sent again once with a
+           refreshed token if the OAuth token expired
+        """
+        replayed = False
+        while True:
+            request_headers, token = self.api._authorize(headers)
+            r,c = self.api.thread_http().request(uri, method, body=body, headers=request_headers,
+                                                 redirections=redirections, connection_type=connection_type)
+            if 401 == r.status and not replayed and self.api._can_refresh():
+                replayed = True
+                self.api.refresh_token(token)
+                continue
+            return r,c
+
+    def __getattr__(self, name):
+        return getattr(self.api.transport, name)
 
 
 class Producteev():
     """Producteev python API"""
 
-    def __init__(self, client_id=CLIENT_ID, client_secret=CLIENT_SECRET, redirect_uri=REDIRECT_URI):
+    def __init__(self, client_id=CLIENT_ID, client_secret=CLIENT_SECRET, redirect_uri=REDIRECT_URI, transport=None, cache=None,
+                 rate_limiter=None, retry=None, codec=json, api_uri=API_URI,
+                 credentials=None, access_token=None, storage=CREDENTIALS_FILE,
+                 interactive=True, flags=None, token_refresh_margin=300, redirects='follow',
+                 single_flight=True, transport_factory=None):
         """Create the Producteev python API based on their REST API
 
            client_id, client_secret are the API key for the application
 
+           The authentification is only done on the first request, see
+           auth(). The credentials (oauth2client Credentials) or the OAuth
+           access_token can be given, else they are read from storage, a
+           TokenCache file name or an oauth2client Storage. If there is no
+           valid credentials, the OAuth flow is run with the oauth2client
+           flags (argparse.Namespace of tools.argparser), unless interactive
+           is False.
+
+           The OAuth token is refreshed token_refresh_margin seconds before
+           it expires, see also start_token_refresh().
+
+           transport is the object sending the HTTP requests, it must
+           provide the httplib2.Http.request() method. By default an
+           httplib2.Http object, see also HttpPool to share connections
+           between threads. The http attribute sends the requests of the
+           transport with the OAuth token.
+
+           transport_factory is the callable creating the transport of
+           each other thread when the transport is not thread-safe, by
+           default httplib2.Http for the default transport. A transport
+           which is not thread-safe and has no factory can only be used
+           from the thread which created the API object.
+
+           cache is an optional ResponseCache for the GET requests.
+
+           rate_limiter is an optional TokenBucket limiting the requests
+           rate, and retry an optional RetryPolicy to send again throttled
+           or failed requests.
+
+           codec is the JSON codec, any object with the loads() and dumps()
+           functions of the json module (e.g. a faster JSON library).
+
+           api_uri is the root URI of the API, e.g. to use a local server.
+
+           redirects is the default handling of the 302 redirections, one
+           of REDIRECTS, see request().
+
+           If single_flight is True (or a SingleFlight shared with other
+           API objects), concurrent identical GET requests (same API, user
+           and headers) share a single HTTP request, see SingleFlight.stats().
+           A GET request sent after a change of its resource (PUT, POST,
+           DELETE) does not share the response of a request sent before.
+
         """
         self.client_id = client_id
         self.client_secret = client_secret
         self.redirect_uri = redirect_uri
-        self.http = httplib2.Http()
-        self.auth()
+        self.api_uri = api_uri
+        self.transport = transport if transport is not None else httplib2.Http()
+        self.http = _AuthorizedHttp(self)
+        if transport_factory is None and transport is None:
+            transport_factory = httplib2.Http
+        self.transport_factory = transport_factory
+        self.cache = cache
+        self.rate_limiter = rate_limiter
+        self.retry = retry
+        self.codec = codec
+        self.hooks = dict((event, []) for event in HOOKS)
+        if access_token is not None:
+            credentials = AccessTokenCredentials(access_token, 'python_producteev')
+        self.credentials = credentials
+        self.storage = TokenCache(storage) if isinstance(storage, basestring) else storage
+        self.interactive = interactive
+        self.flags = flags
+        self.token_refresh_margin = token_refresh_margin
+        if redirects not in REDIRECTS:
+            raise ValueError, "Unknown redirects handling: %s" % redirects
+        self.redirects = redirects
+        self.single_flight = SingleFlight() if single_flight is True else single_flight or None
+        self._authorized = False
+        self._auth_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._owner_thread = threading.current_thread()
+        self._local = threading.local()
 
     # O2AUTH
     def auth(self):
         """Get authentification token from standard OAuth 2.0 flow
 
            This function store the authentification token in a local file,
-           and create an authentificated Http request by adding the OAuth
-           token to the headers.
+           the OAuth token is then added to the headers of every request.
+
+           Credentials given to the constructor are used as is. Else they
+           are read from the storage, and if they are missing or invalid,
+           the OAuth flow is run (which may open a browser), or
+           ProducteevUnauthorized is raised if the API is not interactive.
 
         """
-        flow = OAuth2WebServerFlow(self.client_id, self.client_secret,
-                                    scope = '',
-                                    redirect_uri = self.redirect_uri,
-                                    auth_uri = AUTH_URI,
-                                    token_uri = TOKEN_URI,
-                                    revoke_uri = REVOKE_URI
-                                   )
+        credentials = self.credentials
+        if credentials is None:
+            credentials = self.storage.get()
+        if credentials is None or credentials.invalid:
+            if not self.interactive:
+                raise ProducteevUnauthorized, 'No valid credentials available'
+            flow = OAuth2WebServerFlow(self.client_id, self.client_secret,
+                                        scope = '',
+                                        redirect_uri = self.redirect_uri,
+                                        auth_uri = AUTH_URI,
+                                        token_uri = TOKEN_URI,
+                                        revoke_uri = REVOKE_URI
+                                       )
+            # Do not parse the command line of the host program
+            flags = self.flags or tools.argparser.parse_args([])
+            credentials = tools.run_flow(flow, self.storage, flags)
+        self.credentials = credentials
+        self._authorized = True
+
+    def ensure_auth(self):
+        """Authentificate once, on the first request from any thread"""
+        if not self._authorized:
+            with self._auth_lock:
+                if not self._authorized:
+                    self.auth()
+
+    def _can_refresh(self):
+        return getattr(self.credentials, 'refresh_token', None) is not None
+
+    def _token_expired(self):
+        expiry = getattr(self.credentials, 'token_expiry', None)
+        return expiry is not None and expiry <= datetime.datetime.utcnow()
+
+    def _token_expires_soon(self):
+        expiry = getattr(self.credentials, 'token_expiry', None)
+        if expiry is None or not self._can_refresh():
+            return False
+        margin = datetime.timedelta(seconds=self.token_refresh_margin)
+        return expiry - datetime.datetime.utcnow() < margin
+
+    def refresh_token(self, stale_token=None):
+        """Refresh the OAuth token.
+
+           Concurrent callers wait for a single refresh: if stale_token (the
+           token the caller used) was already replaced by another thread
+           meanwhile, nothing is done. Between processes, the TokenCache
+           lock gives the same guarantee.
+        """
+        with self._refresh_lock:
+            if stale_token is not None and self.credentials.access_token != stale_token:
+                return
+            if DEBUG: print 'Refreshing OAuth token'
+            self.credentials.refresh(httplib2.Http())
+
+    def start_token_refresh(self):
+        """Refresh the OAuth token from a background thread before it
+           expires, instead of just-in-time in the requests.
+        """
+        def run():
+            while True:
+                self.ensure_auth()
+                expiry = getattr(self.credentials, 'token_expiry', None)
+                if expiry is None or not self._can_refresh():
+                    return
+                delay = expiry - datetime.datetime.utcnow()
+                delay = delay.days * 86400 + delay.seconds - self.token_refresh_margin
+                if delay > 0:
+                    time.sleep(delay)
+                    continue
+                try:
+                    self.refresh_token(self.credentials.access_token)
+                except Exception, e:
+                    if DEBUG: print 'ERROR: token refresh failled', e
+                    time.sleep(30)
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _authorize(self, headers):
+        """Return a copy of the headers with the OAuth token, refreshed
+           first if it expires soon, and the token used.
+
+           If the refresh fails before the token expired, the current token
+           is used.
+        """
+        self.ensure_auth()
+        if self._token_expires_soon():
+            try:
+                self.refresh_token(self.credentials.access_token)
+            except Exception, e:
+                if self._token_expired():
+                    raise
+                if DEBUG: print 'ERROR: token refresh failled, using the current token', e
+        headers = dict(headers or {})
+        if self.credentials is None:
+            return headers, None
+        self.credentials.apply(headers)
+        return headers, self.credentials.access_token
 
-        storage = Storage('credentials_producteev.dat')
-        credentials = storage.get()
-        parser = argparse.ArgumentParser(parents=[tools.argparser])
-        flags = parser.parse_args()
+    # HTTP
+    def thread_http(self):
+        """Return the Http object to use from the current thread.
 
-        if credentials is None or credentials.invalid:
-            credentials = tools.run_flow(flow, storage, flags)
-        self.http = credentials.authorize(self.http)
+           httplib2.Http is not thread-safe, so unless the transport is (see
+           HttpPool), every thread other than the one which created the API
+           object gets its own transport from transport_factory. Raise
+           ProducteevError if there is no transport_factory.
+        """
+        if getattr(self.transport, 'thread_safe', False) or threading.current_thread() is self._owner_thread:
+            return self.transport
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            if self.transport_factory is None:
+                raise ProducteevError, "The transport is not thread-safe, give a transport_factory " \
+                                       "or a thread-safe transport (e.g. HttpPool) to use it from other threads"
+            http = self._local.http = self.transport_factory()
+        return http
+
+    def _send(self, uri, method, headers=None, body=None):
+        """Send the request within the rate limit, and send it again as
+           long as the retry policy allows it.
+
+           A request rejected because the OAuth token expired is sent again
+           once with a refreshed token.
+
+           A streamed body (file-like, e.g. a MultipartStream) is sent over
+           a new connection, see _send_stream().
+        """
+        attempt = 0
+        sent = replayed = False
+        position = body.tell() if hasattr(body, 'seek') else None
+        while True:
+            if sent and position is not None:
+                body.seek(position)
+            request_headers, token = self._authorize(headers)
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            try:
+                sent = True
+                http = self.thread_http()
+                if hasattr(body, 'read'):
+                    r,c = self._send_stream(self.api_uri + uri, method, request_headers, body, http)
+                else:
+                    r,c = http.request(self.api_uri + uri, method, headers=request_headers, body=body)
+            except (socket.error, httplib.HTTPException):
+                if self.retry is None or not self.retry.retry_error(method, attempt):
+                    raise
+                delay = self.retry.delay(attempt)
+            else:
+                s = int(r['status'])
+                if 401 == s and not replayed and self._can_refresh():
+                    replayed = True
+                    self.refresh_token(token)
+                    continue
+                if self.retry is None or not self.retry.retry_status(method, s, attempt):
+                    return r,c
+                delay = self.retry.delay(attempt, r)
+                if delay is None:
+                    return r,c
+                if self.rate_limiter is not None and s in self.retry.throttled_statuses:
+                    self.rate_limiter.pause(delay)
+            if DEBUG: print 'RETRY: request', method, uri, 'in', delay, 's'
+            if self.hooks['retry']:
+                self._emit('retry', {'method': method, 'uri': uri, 'attempt': attempt + 1, 'delay': delay})
+            time.sleep(delay)
+            attempt += 1
+
+    def _send_stream(self, url, method, headers, body, http):
+        """Send a request with a streamed body over a new connection, and
+           return the response like httplib2.Http.request().
+
+           httplib2 sends the request again on a new connection when a kept
+           alive one was closed by the server, but a stream already read
+           would then be sent truncated. The request is sent only once
+           here, _send() retries it from the start of the body.
+
+           The connection has the settings (timeout, proxy, certificates)
+           of the transport http, an httplib2.Http or an HttpPool, whose
+           limits it counts in. A custom transport is not used, only its
+           timeout attribute, with the httplib2 defaults.
+        """
+        if isinstance(http, HttpPool):
+            with http.checked_out(url) as pooled:
+                return self._send_stream(url, method, headers, body, pooled)
+        if not isinstance(http, httplib2.Http):
+            http = httplib2.Http(timeout=getattr(http, 'timeout', None))
+        u = urlparse(url)
+        conn = _http_connection(http, u)
+        try:
+            conn.request(method, u.path + ('?' + u.query if u.query else ''), body, headers or {})
+            response = conn.getresponse()
+            return httplib2.Response(response), response.read()
+        finally:
+            conn.close()
 
+    def _forget_flights(self, uri):
+        self.single_flight.forget(lambda key: key[0] == self.api_uri and _related_uris(uri, key[3]))
 
-    # HTTP
-    def request(self, uri, method, headers=None, body=None):
+    def decode(self, r, c):
+        """Decode the content c of the response r if it is JSON.
+
+           Responses with another Content-Type (e.g. downloaded files) are
+           returned as is without trying to parse them.
+        """
+        content_type = r.get('content-type')
+        if not isinstance(c, basestring) or (content_type is not None and 'json' not in content_type):
+            return c
+        try:
+            return self.codec.loads(c)
+        except ValueError:
+            return c
+
+    # HOOKS
+    def add_hook(self, event, callback):
+        """Call callback(info) on the given event, one of HOOKS:
+
+           before_request: info has the method, uri and bytes_out
+           after_response: info has also the status, elapsed time and
+                           bytes_in (not sent for cached responses)
+           on_error:       info has also the error raised
+           retry:          info has the method, uri, attempt and delay
+           cache_hit:      info has the method and uri
+           coalesced:      like after_response, for a request which got
+                           the response of the same concurrent request
+
+           The callbacks are called from the thread sending the request,
+           for the API requests and the downloads of open_url().
+        """
+        self.hooks[event].append(callback)
+
+    def remove_hook(self, event, callback):
+        self.hooks[event].remove(callback)
+
+    def _emit(self, event, info):
+        for callback in self.hooks[event]:
+            callback(info)
+
+    def request(self, uri, method, headers=None, body=None, raw=False, redirects=None):
         """Send the authentificated request to the Producteev API and
            deal with error code and JSON conversion of response.
 
            headers and body are already urlencoded!
            method are standards HTTP methods
+           If raw is True, the content of a successful response is returned
+           undecoded.
+
+           A 302 redirection (not already followed by the transport, like
+           the ones answering a POST) is handled according to redirects,
+           by default the one given to the constructor:
+
+           follow:   GET the location and return its decoded response
+           location: return the location without following it
+           stream:   open the location with open_url() and return the
+                     httplib.HTTPResponse, to read and close by the caller
+
+           The access_token of the location query is removed, the token is
+           sent in the headers.
         """
-        r,c = self.http.request(API_URI + uri, method, headers=headers, body=body)
+        redirects = redirects or self.redirects
+        if redirects not in REDIRECTS:
+            raise ValueError, "Unknown redirects handling: %s" % redirects
+        info = {'method': method, 'uri': uri, 'bytes_out': len(body) if body else 0}
+        self._emit('before_request', info)
+        start = time.time()
+        try:
+            return self._request(uri, method, headers, body, raw, info, redirects)
+        except Exception, e:
+            info['elapsed'] = time.time() - start
+            info['error'] = e
+            self._emit('on_error', info)
+            raise
+
+    def _request(self, uri, method, headers, body, raw, info, redirects):
+        cached = None
+        if self.cache is not None and 'GET' == method:
+            self.ensure_auth()
+            scope = (self.api_uri, getattr(self.credentials, 'access_token', None))
+            cached = self.cache.get(uri, scope)
+
+        if cached is not None and cached[0]:
+            r, c = cached[1], cached[2]
+            self._emit('cache_hit', info)
+        else:
+            if cached is not None:
+                headers = dict(headers or {}, **self.cache.conditional_headers(cached[1]))
+            start = time.time()
+            if self.single_flight is not None and 'GET' == method and (body is None or isinstance(body, basestring)):
+                # Only the requests of the same user with the same headers
+                # are shared. Each caller decodes its own copy of the content
+                self.ensure_auth()
+                key = (self.api_uri, getattr(self.credentials, 'access_token', None),
+                       method, uri, body, tuple(sorted((headers or {}).items())))
+                (r,c), sent = self.single_flight.do(key, self._send, uri, method, headers, body)
+            elif self.single_flight is not None and 'GET' != method:
+                # The GET requests sent before the change are not shared
+                # with the ones sent after
+                self._forget_flights(uri)
+                try:
+                    r,c = self._send(uri, method, headers, body)
+                finally:
+                    self._forget_flights(uri)
+                sent = True
+            else:
+                r,c = self._send(uri, method, headers, body)
+                sent = True
+            info['elapsed'] = time.time() - start
+            info['status'] = int(r['status'])
+            info['bytes_in'] = len(c)
+            self._emit('after_response' if sent else 'coalesced', info)
+
+            if DEBUG:
+                print "Request:", uri, headers, body
+                print "Response:", r, c
+            if self.cache is not None:
+                if 'GET' != method:
+                    self.cache.invalidate(uri)
+                elif cached is not None and '304' == r['status']:
+                    r, c = cached[1], cached[2]
+                    self.cache.store(uri, r, c, scope)
+                    self._emit('cache_hit', info)
+                elif '200' == r['status']:
+                    self.cache.store(uri, r, c, scope)
 
-        if DEBUG:
-            print "Request:", uri, headers, body
-            print "Response:", r, c
         s = int(r['status'])
-        try:
-            c = json.loads(c)
-        except json.JSONDecodeError:
-            pass
 
         # Success
         if   200 == s:
-            return c
+            return c if raw else self.decode(r, c)
         elif 201 == s:
-            return c
+            return c if raw else self.decode(r, c)
         elif 204 == s:
             # Your request was processed but doesn't return any information/object (e.g when you delete an object)
             return None
 
         # Redirection
         if 302 == s:
-            try:
-                # FIXME Hack to trim access_token, else we get
-                #       an HTTP error 500 since the access_token
-                #       is repeated in headers...
-                #       Problem reported to Producteev
-                return self.GET(r['location'].split('?')[0])
-            except KeyError:
-                s = 404
-                c = r
+            if 'location' in r:
+                location = strip_access_token(r['location'])
+                if 'location' == redirects:
+                    return location
+                if 'stream' == redirects:
+                    return self.open_url(location)
+                if location.startswith(self.api_uri):
+                    location = location[len(self.api_uri):]
+                return self.request(location, 'GET', raw=raw)
+            s = 404
+            c = r
 
         # Error
         if DEBUG: print 'ERROR: request failled at URI', uri
 
-        if   400 == s:
-            raise ProducteevBadRequest, c
-        elif 401 == s:
-            raise ProducteevUnauthorized, c
-        elif 403 == s:
-            raise ProducteevAccessDenied, c
-        elif 404 == s:
-            raise ProducteevNotFound, c
-        elif 409 == s:
-            raise ProducteevConflict, c
-        elif 500 == s:
-            raise ProducteevInternalServerError, c
-        else:
-            raise ProducteevUnknown, c
+        raise_for_status(s, self.decode(r, c))
 
-    def _HTTP(self, uri, method, json_obj=None):
+    def _HTTP(self, uri, method, json_obj=None, redirects=None):
         """Helper function for HTTP method taking care to encode JSON obj into
            string if it was not already done.
 
@@ -177,15 +1151,179 @@ class Producteev():
         """
         if json_obj:
             if not type(json_obj) in (unicode, str):
-                json_obj = json.dumps(json_obj)
-            return self.request(uri, method, {'Content-Type': 'application/json'}, json_obj)
+                json_obj = self.codec.dumps(json_obj)
+            return self.request(uri, method, {'Content-Type': 'application/json'}, json_obj, redirects=redirects)
+        else:
+            return self.request(uri, method, redirects=redirects)
+
+    def GET(self, uri, json_obj=None, redirects=None): return self._HTTP(uri, 'GET', json_obj, redirects)
+    def DELETE(self, uri, json_obj=None, redirects=None): return self._HTTP(uri, 'DELETE', json_obj, redirects)
+    def POST(self, uri, json_obj=None, redirects=None): return self._HTTP(uri, 'POST', json_obj, redirects)
+    def PUT(self, uri, json_obj=None, redirects=None): return self._HTTP(uri, 'PUT', json_obj, redirects)
+
+    # DOWNLOADS
+    def open_url(self, url, headers=None, redirections=5, timeout=None, accept=()):
+        """Open url for a streamed download and return the
+           httplib.HTTPResponse, to read by chunks and close by the caller.
+
+           Unlike the Http transport, the body is not loaded in memory.
+           The OAuth token is only sent to the Producteev API host,
+           redirections to another host are followed without it. The
+           error statuses in accept are returned instead of raised.
+
+           The hooks are called for each request like for request(), the
+           bytes_in being the Content-Length of the response.
+        """
+        if url.startswith('/'):
+            url = self.api_uri + url
+        while True:
+            uri = url[len(self.api_uri):] if url.startswith(self.api_uri + '/') else url
+            info = {'method': 'GET', 'uri': uri, 'bytes_out': 0}
+            self._emit('before_request', info)
+            start = time.time()
+            try:
+                conn, r = self._open_url(url, headers, timeout)
+                info['elapsed'] = time.time() - start
+                info['status'] = r.status
+                info['bytes_in'] = int(r.getheader('content-length') or 0)
+                self._emit('after_response', info)
+
+                location = r.getheader('location')
+                if r.status in (301, 302, 303, 307) and location and redirections > 0:
+                    r.read()
+                    conn.close()
+                    url = urljoin(url, location)
+                    redirections -= 1
+                    continue
+                if r.status >= 300 and r.status not in accept:
+                    c = r.read()
+                    conn.close()
+                    if DEBUG: print 'ERROR: download failled at URL', url
+                    raise_for_status(r.status, c)
+                return r
+            except Exception, e:
+                info.setdefault('elapsed', time.time() - start)
+                info['error'] = e
+                self._emit('on_error', info)
+                raise
+
+    def _open_url(self, url, headers=None, timeout=None):
+        """Send a GET request to url, return the connection and response"""
+        if urlparse(url).netloc == urlparse(self.api_uri).netloc:
+            request_headers = self._authorize(headers)[0]
         else:
-            return self.request(uri, method)
+            request_headers = dict(headers or {})
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
 
-    def GET(self, uri, json_obj=None): return self._HTTP(uri, 'GET', json_obj)
-    def DELETE(self, uri, json_obj=None): return self._HTTP(uri, 'DELETE', json_obj)
-    def POST(self, uri, json_obj=None): return self._HTTP(uri, 'POST', json_obj)
-    def PUT(self, uri, json_obj=None): return self._HTTP(uri, 'PUT', json_obj)
+        u = urlparse(url)
+        conn = _connection(u, timeout)
+        try:
+            conn.request('GET', u.path + ('?' + u.query if u.query else ''), headers=request_headers)
+            return conn, conn.getresponse()
+        except Exception:
+            conn.close()
+            raise
+
+    def download(self, url, fileobj, offset=0, chunk_size=65536):
+        """Write by chunks the file at url into fileobj, and return the
+           number of bytes written.
+
+           If offset is given, only the end of the file is requested with a
+           Range header (to resume a partial download). When the server
+           ignores it, fileobj is truncated to be written from the start.
+           When the first offset bytes are already the whole file, nothing
+           is written.
+
+           A ProducteevError is raised if the connection is closed before
+           the end of the file, what is written is kept to be resumed.
+        """
+        headers = {'Range': 'bytes={0}-'.format(offset)} if offset else None
+        r = self.open_url(url, headers, accept=(416,) if offset else ())
+        try:
+            size = download_size(r)
+            if 416 == r.status:
+                r.read()
+                if size != offset:
+                    raise ProducteevError, "Can not resume the download of {0} at {1} bytes of {2}" \
+                                           .format(url, offset, size)
+                return 0
+            if offset and 206 != r.status:
+                fileobj.seek(0)
+                fileobj.truncate()
+                offset = 0
+            written = 0
+            while True:
+                chunk = r.read(chunk_size)
+                if not chunk:
+                    break
+                fileobj.write(chunk)
+                written += len(chunk)
+            if size is not None and offset + written != size:
+                raise ProducteevError, "Download of {0} cut at {1} bytes of {2}".format(url, offset + written, size)
+            return written
+        finally:
+            r.close()
+
+    # BATCH
+    def batch(self, size=50):
+        """Return a Batch context, in which the per-task mutations are
+           queued and then sent through the batch endpoints, see Batch.
+        """
+        return Batch(self, size)
+
+    def current_batch(self):
+        """The Batch context open in the current thread, or None"""
+        return getattr(self._local, 'batch', None)
+
+    def _flush_batch(self, task_id):
+        """Send the calls on task_id queued in the current Batch, before a
+           call on the task which is not queued
+        """
+        batch = self.current_batch()
+        if batch is not None:
+            batch.flush_task(task_id)
+
+    # PAGINATION
+    def _iter_pages(self, fetch, key, per_page=50, prefetch=False):
+        """Generator yielding one by one the objects listed under key in
+           the successive pages returned by fetch(page, per_page).
+
+           The next page is only requested when the current one is
+           exhausted. Iteration stops once total_hits objects were seen or
+           when a page is not full. If prefetch is True, page N+1 is
+           requested in a background thread while page N is consumed.
+        """
+        page = 1
+        seen = 0
+        prefetcher = _Prefetch(fetch, per_page) if prefetch else None
+        try:
+            if prefetcher is not None:
+                prefetcher.request(page)
+            while True:
+                if prefetcher is not None:
+                    result = prefetcher.get()
+                else:
+                    result = fetch(page, per_page)
+                items = (result or {}).get(key) or []
+                seen += len(items)
+                total_hits = (result or {}).get('total_hits')
+                if total_hits is not None:
+                    last_page = seen >= total_hits
+                else:
+                    last_page = len(items) < per_page
+                last_page = last_page or not items
+
+                page += 1
+                if prefetcher is not None and not last_page:
+                    prefetcher.request(page)
+                for item in items:
+                    yield item
+                if last_page:
+                    break
+        finally:
+            if prefetcher is not None:
+                prefetcher.stop()
 
     # ANNOUNCEMENTS
     #   https://api.producteev.com/api/doc/#Announcements
@@ -211,11 +1349,11 @@ class Producteev():
         return self.GET('/api/files/{0}/view'.format(file_id))
 
     def upload_file(self, file_path):
-        if not 'multipart' in sys.modules:
-            import multipart
-        with open(file_path,'r') as f:
-            content_type, body = multipart.get_content_type_and_body({}, {'file': ('file', f)})
-            return self.request('/api/upload/files', 'POST',  {'Content-Type': content_type}, body)
+        import multipart
+        with open(file_path,'rb') as f:
+            # The file is streamed while sent, never loaded in memory
+            headers, body = multipart.get_headers_and_stream({}, {'file': ('file', f)})
+            return self.request('/api/upload/files', 'POST', headers, body)
 
     def upload_remote_file(self, file_name, file_uri):
         return self.POST('/api/upload/remotefiles', {"remoteFile":{"url":file_uri,"fileName":file_name}})
@@ -307,6 +1445,11 @@ class Producteev():
         """
         return self.GET('/api/networks?' + urlencode({'page':page, 'per_page':per_page, 'admin_only':admin_only}))
 
+    def iter_networks(self, admin_only=False, per_page=50, prefetch=False):
+        """Iterate over all the networks of the user, see get_networks()"""
+        fetch = lambda page, per_page: self.get_networks(page, per_page, admin_only)
+        return self._iter_pages(fetch, 'networks', per_page, prefetch)
+
     def create_network(self, title, visible=True, auto_join=False, company_name='', company_size=1):
         network = {
                     "network":{
@@ -342,6 +1485,10 @@ class Producteev():
         """
         return self.GET('/api/networks/{0}/admins'.format(network_id) + '?' + urlencode({'page':page, 'per_page':per_page}))
 
+    def iter_network_admins(self, network_id, per_page=50, prefetch=False):
+        fetch = lambda page, per_page: self.get_network_admins(network_id, page, per_page)
+        return self._iter_pages(fetch, 'users', per_page, prefetch)
+
     def set_network_admin(self, network_id, user_id):
         return self.PUT('/api/networks/{0}/admins/{0}').format(network_id, user_id)
 
@@ -354,17 +1501,25 @@ class Producteev():
        """
        return self.GET('/api/networks/{0}/labels'.format(network_id) + '?' + urlencode({'page':page, 'per_page':per_page}))
 
+    def iter_network_labels(self, network_id, per_page=50, prefetch=False):
+        fetch = lambda page, per_page: self.get_network_labels(network_id, page, per_page)
+        return self._iter_pages(fetch, 'labels', per_page, prefetch)
+
     def search_network_labels(self, network_id, search_query, page=1, per_page=50):
        """Search for Labels inside a network
           This call is paginated
        """
        return self.GET('/api/networks/{0}/labels/search'.format(network_id) + '?' + urlencode({'search':search_query, 'page':page, 'per_page':per_page}))
 
+    def iter_search_network_labels(self, network_id, search_query, per_page=50, prefetch=False):
+        fetch = lambda page, per_page: self.search_network_labels(network_id, search_query, page, per_page)
+        return self._iter_pages(fetch, 'labels', per_page, prefetch)
+
     def get_network_invitations(self, network_id):
         return self.GET('/api/networks/{0}/network_invitations'.format(network_id))
 
-    def get_network_projects(self, project_type='all', page=1, per_page=50):
-        """Search for Labels inside a network
+    def get_network_projects(self, network_id, project_type='all', page=1, per_page=50):
+        """Retrieve the list of the projects of the network
            This call is paginated
 
            You can specify the type of projects you want to be returned:
@@ -372,24 +1527,40 @@ class Producteev():
         """
         return self.GET('/api/networks/{0}/projects'.format(network_id) + '?' + urlencode({'type': project_type, 'page':page, 'per_page':per_page}))
 
+    def iter_network_projects(self, network_id, project_type='all', per_page=50, prefetch=False):
+        fetch = lambda page, per_page: self.get_network_projects(network_id, project_type, page, per_page)
+        return self._iter_pages(fetch, 'projects', per_page, prefetch)
+
     def search_network_projects(self, network_id, search_query, page=1, per_page=50):
        """ Search for Projects inside a network
            This call is paginated
        """
        return self.GET('/api/networks/{0}/projects/search'.format(network_id) + '?' + urlencode({'search':search_query, 'page':page, 'per_page':per_page}))
 
+    def iter_search_network_projects(self, network_id, search_query, per_page=50, prefetch=False):
+        fetch = lambda page, per_page: self.search_network_projects(network_id, search_query, page, per_page)
+        return self._iter_pages(fetch, 'projects', per_page, prefetch)
+
     def get_network_users(self, network_id, page=1, per_page=50):
         """Retrieve the list of the users of the network.
            This call is paginated
         """
         return self.GET('/api/networks/{0}/users'.format(network_id)  + '?' + urlencode({'page':page, 'per_page':per_page}))
 
+    def iter_network_users(self, network_id, per_page=50, prefetch=False):
+        fetch = lambda page, per_page: self.get_network_users(network_id, page, per_page)
+        return self._iter_pages(fetch, 'users', per_page, prefetch)
+
     def search_network_users(self, network_id, search_query, page=1, per_page=50):
        """ Search for users inside a network
            This call is paginated
        """
        return self.GET('/api/networks/{0}/users/search'.format(network_id) + '?' + urlencode({'search':search_query, 'page':page, 'per_page':per_page}))
 
+    def iter_search_network_users(self, network_id, search_query, per_page=50, prefetch=False):
+        fetch = lambda page, per_page: self.search_network_users(network_id, search_query, page, per_page)
+        return self._iter_pages(fetch, 'users', per_page, prefetch)
+
     def delete_network_user(self, network_id, user_id):
         return self.DELETE('/api/networks/{0}/users/{0}'.format(network_id, user_id))
 
@@ -404,6 +1575,7 @@ class Producteev():
                 "task":{"id":task_id}
             }
         }
+        self._flush_batch(task_id)
         return self.POST('/api/notes', note)
 
     def get_note(self, note_id):
@@ -434,7 +1606,7 @@ class Producteev():
     # PROJECT
     #   https://www.producteev.com/api/doc/#Projects
     def create_project(self, title, description, restricted, locked, network_id ):
-        project = json.dumps({
+        project = {
                     "project":{
                       "title":title,
                       "description":description,
@@ -442,7 +1614,7 @@ class Producteev():
                       "locked":locked,
                       "network":{"id":network_id}
                     }
-                  })
+                  }
         return self.POST('/api/projects', project)
 
     def get_project(self, project_id):
@@ -461,7 +1633,7 @@ class Producteev():
         if network_id:
             project['network']['id'] = network_id
 
-        return self.PUT('/api/projects/{0}'.format(project_id), json.dumps(project))
+        return self.PUT('/api/projects/{0}'.format(project_id), project)
 
     def delete_project(self, project_id):
         return self.DELETE('/api/projects/{0}'.format(project_id))
@@ -474,6 +1646,10 @@ class Producteev():
         """
         return self.GET('/api/projects/{0}/activities'.format(project_id) + '?' + urlencode({'page':page,'per_page':per_page}))
 
+    def iter_project_activities(self, project_id, per_page=50, prefetch=False):
+        fetch = lambda page, per_page: self.get_project_activities(project_id, page, per_page)
+        return self._iter_pages(fetch, 'activities', per_page, prefetch)
+
     def get_project_admins(self, project_id):
         return self.GET('/api/projects/{0}/admins'.format(project_id))
 
@@ -491,6 +1667,10 @@ class Producteev():
         """
         return self.GET('/api/projects/{0}/followers'.format(project_id) + '?' + urlencode({'page':page,'per_page':per_page}))
 
+    def iter_project_followers(self, project_id, per_page=50, prefetch=False):
+        fetch = lambda page, per_page: self.get_project_followers(project_id, page, per_page)
+        return self._iter_pages(fetch, 'users', per_page, prefetch)
+
     def add_project_follower(self, project_id, follower_id):
         return self.PUT('/api/projects/{0}/followers/{1}'.format(project_id, follower_id))
 
@@ -519,16 +1699,20 @@ class Producteev():
         return self.POST('/api/tasks', task)
 
     def update_tasks(self, tasks_list):
-        return self.POST('/api/tasks', json.dumps(tasks_list))
+        return self.POST('/api/tasks', tasks_list)
 
     def delete_tasks(self, tasks_list):
         return self.DELETE('/api/tasks', tasks_list)
 
-    def export_tasks(self, criteria='', filters={'alias':'all','sort':'created_at','order':'desc'}):
+    def export_tasks(self, criteria='', filters={'alias':'all','sort':'created_at','order':'desc'}, redirects=None):
         """
         Return the location of a CVS exported file with all
         the tasks matching the criteria and filters given.
 
+        The returned value depends on redirects, see request(): the file
+        object (follow), its URI without a second request (location) or
+        the opened response (stream).
+
         By default it will return the list of all active tasks.
 
         In case of success the request return in the header the location
@@ -562,7 +1746,52 @@ class Producteev():
         For more details and other filters options see https://www.producteev.com/api/doc/#Search
 
         """
-        return self.POST('/api/tasks/export?' + urlencode(filters), criteria)
+        return self.POST('/api/tasks/export?' + urlencode(filters), criteria, redirects)
+
+    def iter_export_tasks(self, criteria='', filters={'alias':'all','sort':'created_at','order':'desc'},
+                          gzip_path=None, chunk_size=65536):
+        """Export the tasks matching the criteria and filters and iterate
+           over the rows of the exported CSV file as dictionaries.
+
+           The file is downloaded by chunks while iterating and decompressed
+           on the fly if it is sent gzipped, so it is never loaded in
+           memory. If gzip_path is given, the CSV file is written there
+           compressed at the same time.
+           For details about criteria and filters see self.export_tasks()
+        """
+        r = self.export_tasks(criteria, filters, redirects='stream')
+        if 'json' in (r.getheader('content-type') or ''):
+            # The location is the file object, not yet the CSV file
+            try:
+                url = self.decode({'content-type': 'application/json'}, r.read())['file']['url']
+            finally:
+                r.close()
+            r = self.open_url(url)
+        gzipped = 'gzip' in (r.getheader('content-encoding') or '') \
+                  or 'gzip' in (r.getheader('content-type') or '')
+        decompress = zlib.decompressobj(16 + zlib.MAX_WBITS) if gzipped else None
+        output = gzip.open(gzip_path, 'wb') if gzip_path else None
+
+        def chunks():
+            for chunk in iter(lambda: r.read(chunk_size), ''):
+                if decompress is not None:
+                    chunk = decompress.decompress(chunk)
+                if output is not None:
+                    output.write(chunk)
+                yield chunk
+            if decompress is not None:
+                chunk = decompress.flush()
+                if output is not None:
+                    output.write(chunk)
+                yield chunk
+
+        try:
+            for row in csv.DictReader(iter_lines(chunks())):
+                yield row
+        finally:
+            r.close()
+            if output is not None:
+                output.close()
 
     def add_tasks_label(self, tasks_list, label_id):
         """Add a label to a list of tasks"""
@@ -570,7 +1799,7 @@ class Producteev():
 
     def add_tasks_user(self, tasks_list, user_id):
         """Add a Responsible to a list of tasks"""
-        return self.PUT('/api/tasks/responsibles/{user_id}'.format(user_id), tasks_list)
+        return self.PUT('/api/tasks/responsibles/{0}'.format(user_id), tasks_list)
 
     def search_tasks(self, criteria='', filters={'alias':'all','sort':'created_at','order':'desc'}, page=1, per_page=50):
         """Return a list of tasks matching search criteria and filters.
@@ -580,6 +1809,62 @@ class Producteev():
         """
         return self.POST('/api/tasks/search?' + urlencode(filters) + '&' + urlencode({'page':page,'per_page':per_page}), criteria)
 
+    def iter_search_tasks(self, criteria='', filters={'alias':'all','sort':'created_at','order':'desc'}, per_page=50, prefetch=False):
+        """Iterate over all the tasks matching search criteria and filters,
+           the pages are requested one after the other while iterating.
+           See self.search_tasks()
+        """
+        fetch = lambda page, per_page: self.search_tasks(criteria, filters, page, per_page)
+        return self._iter_pages(fetch, 'tasks', per_page, prefetch)
+
+    def iter_search_tasks_parallel(self, criteria='', filters={'alias':'all','sort':'created_at','order':'desc'}, per_page=50, workers=4, ordered=True):
+        """Iterate over all the tasks matching search criteria and filters,
+           fetching the pages concurrently.
+
+           Once the first page gives total_hits, the remaining pages are
+           requested by a pool of workers threads, each one using its own
+           Http object. Tasks are yielded in pages order, or as soon as a
+           page is received if ordered is False.
+           See self.search_tasks()
+        """
+        first = self.search_tasks(criteria, filters, 1, per_page) or {}
+        for task in first.get('tasks') or []:
+            yield task
+
+        total_hits = first.get('total_hits') or 0
+        pages = xrange(2, (total_hits + per_page - 1) // per_page + 1)
+        if not pages:
+            return
+
+        fetch = lambda page: self.search_tasks(criteria, filters, page, per_page)
+        for page, result, exc_info in bounded_map(fetch, pages, min(workers, len(pages)), ordered):
+            if exc_info is not None:
+                raise exc_info[0], exc_info[1], exc_info[2]
+            for task in (result or {}).get('tasks') or []:
+                yield task
+
+    def iter_tasks_fanout(self, tasks, resource='get_task_notes', workers=8, ordered=False):
+        """Call the task method resource (e.g. get_task, get_task_notes,
+           get_task_activities, or any function of a task id) for each
+           task concurrently, and yield (task_id, result) tuples.
+
+           tasks is an iterable of task ids or of task objects, like the
+           iter_search_tasks() iterators, consumed as the calls go. At most
+           workers calls run at once. Results come as soon as they are
+           ready, or in the tasks order if ordered is True.
+
+           A call raising an error does not stop the iteration, the
+           exception is yielded in place of its result.
+
+           Example:
+               for task_id, notes in p.iter_tasks_fanout(p.iter_search_tasks()):
+                   if isinstance(notes, ProducteevError): ...
+        """
+        method = getattr(self, resource) if isinstance(resource, basestring) else resource
+        task_ids = (task['id'] if isinstance(task, dict) else task for task in tasks)
+        for task_id, result, exc_info in bounded_map(method, task_ids, workers, ordered):
+            yield task_id, result if exc_info is None else exc_info[1]
+
     def get_tasks_alias_counts(self):
         """Return the number of tasks for each alias"""
         return self.POST('/api/tasks/search/counts')
@@ -591,9 +1876,15 @@ class Producteev():
         """Update given task by changing the task attributes passed as
            keywords arguments
         """
-        return self.PUT('/api/tasks/{0}'.format(task_id), json.dumps({"task":kwargs}))
+        batch = self.current_batch()
+        if batch is not None:
+            return batch.add('update_task', None, dict(kwargs, id=task_id))
+        return self.PUT('/api/tasks/{0}'.format(task_id), {"task":kwargs})
 
     def delete_task(self, task_id):
+        batch = self.current_batch()
+        if batch is not None:
+            return batch.add('delete_task', None, {'id': task_id})
         return self.DELETE('/api/tasks/{0}'.format(task_id))
 
     def get_task_activities(self, task_id, page=1, per_page=50):
@@ -603,25 +1894,39 @@ class Producteev():
         """
         return self.GET('/api/tasks/{0}/activities'.format(task_id) + '?' + urlencode({'page':page,'per_page':per_page}))
 
+    def iter_task_activities(self, task_id, per_page=50, prefetch=False):
+        fetch = lambda page, per_page: self.get_task_activities(task_id, page, per_page)
+        return self._iter_pages(fetch, 'activities', per_page, prefetch)
+
     def add_task_follower(self, task_id, user_id):
+        self._flush_batch(task_id)
         return self.PUT('/api/tasks/{0}/followers/{1}'.format(task_id, user_id))
 
     def delete_task_follower(self, task_id, user_id):
+        self._flush_batch(task_id)
         return self.DELETE('/api/tasks/{0}/followers/{1}'.format(task_id, user_id))
 
     def add_task_label(self, task_id, label_id):
+        batch = self.current_batch()
+        if batch is not None:
+            return batch.add('add_task_label', label_id, {'id': task_id})
         return self.PUT('/api/tasks/{0}/labels/{1}'.format(task_id, label_id))
 
     def delete_task_label(self, task_id, label_id):
+        self._flush_batch(task_id)
         return self.DELETE('/api/tasks/{0}/labels/{1}'.format(task_id, label_id))
 
     def get_task_notes(self, task_id):
         return self.GET('/api/tasks/{0}/notes'.format(task_id))
 
     def add_task_responsible(self, task_id, user_id):
+        batch = self.current_batch()
+        if batch is not None:
+            return batch.add('add_task_responsible', user_id, {'id': task_id})
         return self.PUT('/api/tasks/{0}/responsibles/{1}'.format(task_id, user_id))
 
     def delete_task_responsible(self, task_id, user_id):
+        self._flush_batch(task_id)
         return self.DELETE('/api/tasks/{0}/responsibles/{1}'.format(task_id, user_id))
 
     def create_subtask(self, task_id, title, status=1):
@@ -631,13 +1936,16 @@ class Producteev():
                         "status":1
                         }
                   }
+        self._flush_batch(task_id)
         return self.POST('/api/tasks/{0}/subtasks'.format(task_id), subtask)
 
     def update_subtask(self, task_id, subtask_id, **kwargs):
         """Update a subtask in a task form keywords arguments"""
+        self._flush_batch(task_id)
         return self.PUT('/api/tasks/{0}/subtasks/{0}'.format(task_id, subtask_id), {'subtask':kwargs})
 
     def delete_subtask(self, task_id, subtask_id):
+        self._flush_batch(task_id)
         return self.DELETE('/api/tasks/{0}/subtasks/{0}'.format(task_id, subtask_id))
 
 
@@ -667,11 +1975,11 @@ class Producteev():
         return self.PUT('/api/users/me',{"user":kwargs})
 
     def upload_avatar(self, file_path):
-        if not 'multipart' in sys.modules:
-            import multipart
-        with open(file_path,'r') as f:
-            content_type, body = multipart.get_content_type_and_body({}, {'avatar': ('avatar', f)})
-            return self.request('/api/users/me/avatar', 'POST',  {'Content-Type': content_type}, body)
+        import multipart
+        with open(file_path,'rb') as f:
+            # The file is streamed while sent, never loaded in memory
+            headers, body = multipart.get_headers_and_stream({}, {'avatar': ('avatar', f)})
+            return self.request('/api/users/me/avatar', 'POST', headers, body)
 
     def get_default_project(self):
         """Retrieve the current user's default project"""
@@ -690,6 +1998,306 @@ class Producteev():
         """
         return self.GET('/api/users/search?' + urlencode({'email':email,'exclude_loggedin_user':exclude_loggedin_user,'page':page,'per_page':per_page}))
 
-    def get_user(self, user_id):
-        return self.GET('/api/users/{id}'.format(user_id))
+    def iter_search_users(self, email, exclude_loggedin_user=True, per_page=50, prefetch=False):
+        fetch = lambda page, per_page: self.search_users(email, exclude_loggedin_user, page, per_page)
+        return self._iter_pages(fetch, 'users', per_page, prefetch)
 
+    def get_user(self, user_id):
+        return self.GET('/api/users/{0}'.format(user_id))
+
+
+
+class Metrics(object):
+    """Collect the requests metrics of a Producteev object through its hooks
+
+       The requests are counted per method and endpoint template, the URI
+       path where the ids are replaced by {id}. For each endpoint it records
+       a latency histogram, the bytes sent and received, the count of each
+       status, the errors, the retries, the cache hits and the coalesced
+       requests.
+
+       Example:
+           metrics = Metrics()
+           metrics.install(p)
+           ...
+           print metrics.prometheus()
+    """
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+    ID = re.compile(r'^([0-9a-f]{24}|\d+)$')
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.endpoints = {}
+        self._lock = threading.Lock()
+
+    def install(self, api):
+        api.add_hook('after_response', self.after_response)
+        api.add_hook('on_error', self.on_error)
+        api.add_hook('retry', self.retry)
+        api.add_hook('cache_hit', self.cache_hit)
+        api.add_hook('coalesced', self.coalesced)
+        return self
+
+    def template(self, uri):
+        path = urlparse(uri).path
+        return '/'.join('{id}' if self.ID.match(part) else part for part in path.split('/'))
+
+    def _endpoint(self, info):
+        key = (info['method'], self.template(info['uri']))
+        endpoint = self.endpoints.get(key)
+        if endpoint is None:
+            endpoint = self.endpoints[key] = {
+                'count': 0, 'latency_sum': 0.0, 'latency_buckets': [0] * len(self.buckets),
+                'bytes_in': 0, 'bytes_out': 0, 'statuses': {},
+                'errors': 0, 'retries': 0, 'cache_hits': 0, 'coalesced': 0}
+        return endpoint
+
+    def after_response(self, info):
+        with self._lock:
+            endpoint = self._endpoint(info)
+            endpoint['count'] += 1
+            endpoint['latency_sum'] += info['elapsed']
+            for i, bound in enumerate(self.buckets):
+                if info['elapsed'] <= bound:
+                    endpoint['latency_buckets'][i] += 1
+                    break
+            endpoint['bytes_in'] += info['bytes_in']
+            endpoint['bytes_out'] += info['bytes_out']
+            statuses = endpoint['statuses']
+            statuses[info['status']] = statuses.get(info['status'], 0) + 1
+
+    def on_error(self, info):
+        with self._lock:
+            self._endpoint(info)['errors'] += 1
+
+    def retry(self, info):
+        with self._lock:
+            self._endpoint(info)['retries'] += 1
+
+    def cache_hit(self, info):
+        with self._lock:
+            self._endpoint(info)['cache_hits'] += 1
+
+    def coalesced(self, info):
+        with self._lock:
+            self._endpoint(info)['coalesced'] += 1
+
+    def as_dict(self):
+        """Return the metrics by 'METHOD /endpoint/template'"""
+        with self._lock:
+            metrics = {}
+            for (method, template), endpoint in self.endpoints.items():
+                endpoint = dict(endpoint, statuses=dict(endpoint['statuses']),
+                                latency_buckets=dict(zip(self.buckets, endpoint['latency_buckets'])))
+                metrics[method + ' ' + template] = endpoint
+            return metrics
+
+    def prometheus(self, prefix='producteev'):
+        """Return the metrics in the Prometheus text exposition format"""
+        lines = []
+        def add(name, kind, samples):
+            lines.append('# TYPE {0}_{1} {2}'.format(prefix, name, kind))
+            for labels, value in samples:
+                labels = ','.join('{0}="{1}"'.format(k, v) for k, v in labels)
+                lines.append('{0}_{1}{{{2}}} {3}'.format(prefix, name, labels, value))
+
+        with self._lock:
+            endpoints = sorted(self.endpoints.items())
+            histogram = []
+            for (method, template), endpoint in endpoints:
+                cumulative = 0
+                for bound, count in zip(self.buckets, endpoint['latency_buckets']):
+                    cumulative += count
+                    histogram.append(([('method', method), ('endpoint', template), ('le', bound)], cumulative))
+                histogram.append(([('method', method), ('endpoint', template), ('le', '+Inf')], endpoint['count']))
+            lines.append('# TYPE {0}_request_seconds histogram'.format(prefix))
+            for labels, value in histogram:
+                labels = ','.join('{0}="{1}"'.format(k, v) for k, v in labels)
+                lines.append('{0}_request_seconds_bucket{{{1}}} {2}'.format(prefix, labels, value))
+            for (method, template), endpoint in endpoints:
+                labels = 'method="{0}",endpoint="{1}"'.format(method, template)
+                lines.append('{0}_request_seconds_sum{{{1}}} {2}'.format(prefix, labels, endpoint['latency_sum']))
+                lines.append('{0}_request_seconds_count{{{1}}} {2}'.format(prefix, labels, endpoint['count']))
+
+            endpoint_labels = lambda method, template: [('method', method), ('endpoint', template)]
+            for name in ('bytes_in', 'bytes_out', 'errors', 'retries', 'cache_hits', 'coalesced'):
+                add(name + '_total', 'counter',
+                    [(endpoint_labels(method, template), endpoint[name]) for (method, template), endpoint in endpoints])
+            add('responses_total', 'counter',
+                [(endpoint_labels(method, template) + [('status', status)], count)
+                 for (method, template), endpoint in endpoints
+                 for status, count in sorted(endpoint['statuses'].items())])
+        return '\n'.join(lines) + '\n'
+
+
+class Batch(object):
+    """Queue per-task mutations and send them through the batch endpoints
+
+       Inside the context, calls from the same thread to update_task(),
+       delete_task(), add_task_label() and add_task_responsible() return
+       None at once and are queued. When leaving the context, the queued
+       calls are grouped by operation and target (label or user) and sent
+       in chunks of size tasks with update_tasks(), delete_tasks(),
+       add_tasks_label() and add_tasks_user(). The groups are sent in the
+       order of their first queued call.
+
+       The other calls changing a task (e.g. delete_task_label()) are not
+       queued: the groups with a call on the task are sent before them, so
+       add_task_label() then delete_task_label() leave the task unlabeled.
+       A group may thus be sent in several chunks smaller than size.
+
+       results lists a (operation, target, task, result, error) tuple for
+       each queued call, error being the ProducteevError or the connection
+       error (socket.error, httplib.HTTPException) raised by its chunk or
+       None. A failed chunk does not stop the other ones.
+
+       Example:
+           with p.batch(100) as batch:
+               for task_id in task_ids:
+                   p.add_task_label(task_id, label_id)
+           print batch.errors
+    """
+
+    def __init__(self, api, size=50):
+        self.api = api
+        self.size = size
+        self.queue = OrderedDict() # (operation, target) -> tasks
+        self.results = []
+
+    def add(self, operation, target, task):
+        self.queue.setdefault((operation, target), []).append(task)
+
+    def _send(self, operation, target, tasks_list):
+        if 'update_task' == operation:
+            return self.api.update_tasks(tasks_list)
+        elif 'delete_task' == operation:
+            return self.api.delete_tasks(tasks_list)
+        elif 'add_task_label' == operation:
+            return self.api.add_tasks_label(tasks_list, target)
+        elif 'add_task_responsible' == operation:
+            return self.api.add_tasks_user(tasks_list, target)
+        raise ProducteevNotImplemented, operation
+
+    def flush(self):
+        """Send the queued calls"""
+        queue, self.queue = self.queue, OrderedDict()
+        self._flush(queue.items())
+
+    def flush_task(self, task_id):
+        """Send the queued groups having a call on task_id"""
+        keys = [key for key, tasks in self.queue.items() if any(task_id == task['id'] for task in tasks)]
+        self._flush([(key, self.queue.pop(key)) for key in keys])
+
+    def _flush(self, groups):
+        for (operation, target), tasks in groups:
+            for i in xrange(0, len(tasks), self.size):
+                chunk = tasks[i:i + self.size]
+                result = error = None
+                try:
+                    result = self._send(operation, target, {'tasks': chunk})
+                except (ProducteevError, socket.error, httplib.HTTPException), e:
+                    error = e
+                for task in chunk:
+                    self.results.append((operation, target, task, result, error))
+
+    @property
+    def errors(self):
+        return [r for r in self.results if r[4] is not None]
+
+    def __enter__(self):
+        if self.api.current_batch() is not None:
+            raise ProducteevError, "Batch contexts can not be nested"
+        self.api._local.batch = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.api._local.batch = None
+        if exc_type is None:
+            self.flush()
+        return False
+
+
+class AsyncProducteev(object):
+    """Non-blocking API mirroring the Producteev endpoint methods
+
+       Every public method of the wrapped Producteev object can be called
+       with the same arguments, but returns at once an AsyncResult whose
+       get() gives the response or raises the same ProducteevError as the
+       blocking call. The calls run on a pool of workers threads, which
+       bounds the number of concurrent requests. The pool is started on
+       the first call, close() stops it.
+
+       Example:
+           ap = AsyncProducteev(Producteev(transport=HttpPool(20)), workers=20)
+           task, notes = ap.gather(ap.get_task(task_id), ap.get_task_notes(task_id))
+           tasks = ap.bulk('get_task', task_ids)
+    """
+
+    def __init__(self, api, workers=10):
+        self.api = api
+        self.workers = workers
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    @property
+    def pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPool(self.workers)
+            return self._pool
+
+    def __getattr__(self, name):
+        method = getattr(self.api, name)
+        if name.startswith('_') or name.startswith('iter_') or not callable(method):
+            raise AttributeError(name)
+        def call(*args, **kwargs):
+            return self.pool.apply_async(method, args, kwargs)
+        call.__name__ = name
+        call.__doc__ = method.__doc__
+        return call
+
+    def gather(self, *results, **kwargs):
+        """Wait for the given AsyncResult and return their values in order
+
+           If return_exceptions=True is given, the exception raised by a
+           call is returned in place of its value instead of being raised.
+        """
+        return_exceptions = kwargs.pop('return_exceptions', False)
+        values = []
+        for result in results:
+            try:
+                values.append(result.get())
+            except Exception, e:
+                if not return_exceptions:
+                    raise
+                values.append(e)
+        return values
+
+    def bulk(self, name, arguments, concurrency=None, return_exceptions=False):
+        """Call the endpoint method name once for each item of arguments
+           and return the list of the results in the same order.
+
+           An item is either a tuple of positional arguments or the single
+           argument of the call, e.g. bulk('get_task', task_ids). At most
+           concurrency calls (default: the number of workers) run at once.
+        """
+        method = getattr(self.api, name)
+        call = lambda args: method(*args) if isinstance(args, tuple) else method(args)
+        values = []
+        concurrency = min(concurrency or self.workers, self.workers)
+        for args, value, exc_info in bounded_map(call, arguments, concurrency, pool=self.pool):
+            if exc_info is not None:
+                if not return_exceptions:
+                    raise exc_info[0], exc_info[1], exc_info[2]
+                value = exc_info[1]
+            values.append(value)
+        return values
+
+    def close(self):
+        """Stop the workers once the pending calls are done"""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+            pool.join()
@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+
+Copyright © 2014 François Bianco <francois.bianco@skadi.ch>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+See COPYING file for the full license.
+
+Columnar snapshots of tasks for reports, requires NumPy.
+
+"""
+
+import calendar
+import os
+import time
+from array import array
+
+import numpy as np
+import simplejson as json
+
+from producteev_sync import timestamp, _write_json
+
+"""Value of the missing dates"""
+NO_DATE = np.iinfo(np.int64).min
+
+"""Status of the active tasks, the other ones are completed"""
+STATUS_ACTIVE = 1
+
+"""Columns of the snapshot:
+   SCALARS by name and dtype, REFS to one object and LISTS of objects by
+   name and dictionary of the object ids. Each list is stored as its
+   values and the offsets of the values of each task.
+"""
+SCALARS = {'status': np.int8, 'priority': np.int8, 'deleted': np.bool_,
+           'deadline': np.int64, 'created_at': np.int64, 'updated_at': np.int64}
+REFS = {'network': 'networks', 'project': 'projects', 'creator': 'users'}
+LISTS = {'responsibles': 'users', 'followers': 'users', 'labels': 'labels'}
+DICTIONARIES = ('networks', 'projects', 'users', 'labels')
+
+"""Search criteria keys of the columns, see Producteev.search_tasks()"""
+CRITERIA = {'statuses': 'status', 'priorities': 'priority', 'networks': 'network',
+            'projects': 'project', 'creators': 'creator', 'responsibles': 'responsibles',
+            'followers': 'followers', 'labels': 'labels'}
+RANGES = ('deadline', 'created_at', 'updated_at')
+
+
+def _id(obj):
+    return (obj or {}).get('id')
+
+
+class Dictionary(object):
+    """Dictionary encoding of ids to consecutive integer codes"""
+
+    def __init__(self, ids=()):
+        self.ids = list(ids)
+        self.codes = dict((object_id, code) for code, object_id in enumerate(self.ids))
+
+    def encode(self, object_id):
+        if object_id is None:
+            return -1
+        code = self.codes.get(object_id)
+        if code is None:
+            code = self.codes[object_id] = len(self.ids)
+            self.ids.append(object_id)
+        return code
+
+    def lookup(self, ids):
+        """Codes of the known ids"""
+        return np.array([self.codes[i] for i in ids if i in self.codes], dtype=np.int32)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class TaskSnapshot(object):
+    """Tasks stored column by column in NumPy arrays
+
+       The ids of the networks, projects, users and labels are dictionary
+       encoded: the columns hold integer codes (-1 for none) into the
+       dictionaries. A snapshot is saved as one .npy file per column, and
+       loaded memory-mapped, so only the columns used are read.
+
+       Filters are boolean masks over the tasks, e.g. from mask() which
+       takes the search criteria of Producteev.search_tasks(), and can be
+       combined with & and |.
+
+       Example:
+           snapshot = TaskSnapshot.build(p.iter_search_tasks(prefetch=True))
+           snapshot.save('snapshot')
+           snapshot = TaskSnapshot.load('snapshot')
+           late = snapshot.mask({'projects': [project_id]}) & snapshot.late()
+           print snapshot.count_by('responsibles', late)
+    """
+
+    def __init__(self, columns, dictionaries, built_at=None):
+        self.columns = columns
+        self.dictionaries = dictionaries
+        self.built_at = built_at
+
+    def __len__(self):
+        return len(self.columns['id'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    @classmethod
+    def build(cls, tasks):
+        """Build the snapshot of an iterable of tasks (JSON objects), e.g.
+           from Producteev.iter_search_tasks() or SQLiteTaskStore.query()
+        """
+        dictionaries = dict((name, Dictionary()) for name in DICTIONARIES)
+        ids = []
+        buffers = dict((name, array('b' if SCALARS[name] in (np.int8, np.bool_) else 'd'))
+                       for name in SCALARS)
+        refs = dict((name, array('i')) for name in REFS)
+        lists = dict((name, array('i')) for name in LISTS)
+        offsets = dict((name, [0]) for name in LISTS)
+
+        for task in tasks:
+            ids.append(task['id'])
+            project = task.get('project') or {}
+            buffers['status'].append(task.get('status') or 0)
+            buffers['priority'].append(task.get('priority') or 0)
+            buffers['deleted'].append(bool(task.get('deleted_at') or task.get('deleted')))
+            for name in RANGES:
+                value = timestamp(task.get(name))
+                buffers[name].append(float('nan') if value is None else value)
+            refs['network'].append(dictionaries['networks'].encode(
+                                   _id(task.get('network')) or _id(project.get('network'))))
+            refs['project'].append(dictionaries['projects'].encode(_id(project)))
+            refs['creator'].append(dictionaries['users'].encode(_id(task.get('creator'))))
+            for name, dictionary in LISTS.items():
+                values = [dictionaries[dictionary].encode(_id(obj))
+                          for obj in task.get(name) or [] if _id(obj)]
+                lists[name].extend(values)
+                offsets[name].append(offsets[name][-1] + len(values))
+
+        columns = {'id': np.array(ids, dtype='S')}
+        for name, dtype in SCALARS.items():
+            if np.int64 == dtype:
+                column = np.array(buffers[name], dtype=np.float64)
+                missing = np.isnan(column)
+                column[missing] = 0
+                column = column.astype(np.int64)
+                column[missing] = NO_DATE
+            else:
+                column = np.array(buffers[name], dtype=dtype)
+            columns[name] = column
+        for name in REFS:
+            columns[name] = np.array(refs[name], dtype=np.int32)
+        for name in LISTS:
+            columns[name] = np.array(lists[name], dtype=np.int32)
+            columns[name + '_offsets'] = np.array(offsets[name], dtype=np.int64)
+        return cls(columns, dictionaries, time.time())
+
+    def save(self, directory):
+        """Save the snapshot as .npy files in directory"""
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for name, column in self.columns.items():
+            np.save(os.path.join(directory, name + '.npy'), column)
+        for name, dictionary in self.dictionaries.items():
+            np.save(os.path.join(directory, 'dictionary_' + name + '.npy'),
+                    np.array(dictionary.ids or [''], dtype='S')[:len(dictionary)])
+        _write_json(os.path.join(directory, 'snapshot.json'),
+                    {'tasks': len(self), 'built_at': self.built_at, 'columns': sorted(self.columns)})
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Load a saved snapshot, with the columns memory-mapped unless
+           mmap is False
+        """
+        with open(os.path.join(directory, 'snapshot.json'), 'rb') as f:
+            meta = json.load(f)
+        mode = 'r' if mmap else None
+        columns = dict((name, np.load(os.path.join(directory, name + '.npy'), mmap_mode=mode))
+                       for name in meta['columns'])
+        dictionaries = dict((name, Dictionary(np.load(os.path.join(directory, 'dictionary_' + name + '.npy')).tolist()))
+                            for name in DICTIONARIES)
+        return cls(columns, dictionaries, meta['built_at'])
+
+    # Filters
+    def all(self):
+        return np.ones(len(self), dtype=np.bool_)
+
+    def _lengths(self, name):
+        return np.diff(self.columns[name + '_offsets'])
+
+    def _any(self, name, codes):
+        """Mask of the tasks with one of the codes in the list column"""
+        hits = np.concatenate(([0], np.cumsum(np.in1d(self.columns[name], codes))))
+        offsets = self.columns[name + '_offsets']
+        return hits[offsets[1:]] > hits[offsets[:-1]]
+
+    def mask(self, criteria=None, include_deleted=False):
+        """Mask of the tasks matching the search criteria, see
+           Producteev.search_tasks() for their format
+        """
+        criteria = criteria or {}
+        mask = self.all() if include_deleted else ~self.columns['deleted']
+        for key, name in CRITERIA.items():
+            values = criteria.get(key)
+            if not values:
+                continue
+            if name in SCALARS:
+                mask &= np.in1d(self.columns[name], values)
+            elif name in REFS:
+                mask &= np.in1d(self.columns[name], self.dictionaries[REFS[name]].lookup(values))
+            else:
+                mask &= self._any(name, self.dictionaries[LISTS[name]].lookup(values))
+        for name in RANGES:
+            bounds = criteria.get(name) or {}
+            column = self.columns[name]
+            if bounds.get('from') is not None:
+                mask &= column >= timestamp(bounds['from'])
+            if bounds.get('to') is not None:
+                mask &= (column <= timestamp(bounds['to'])) & (column != NO_DATE)
+        return mask
+
+    def active(self):
+        return (self.columns['status'] == STATUS_ACTIVE) & ~self.columns['deleted']
+
+    def late(self, now=None):
+        """Mask of the active tasks past their deadline"""
+        deadline = self.columns['deadline']
+        return self.active() & (deadline != NO_DATE) & (deadline < (now or time.time()))
+
+    def due_between(self, start, end):
+        """Mask of the active tasks with a deadline in [start, end["""
+        deadline = self.columns['deadline']
+        return self.active() & (deadline >= start) & (deadline < end)
+
+    # Aggregates
+    def count_by(self, name, mask=None):
+        """Number of tasks of mask (default all) by value of the column
+           name, the ids for the referenced objects
+        """
+        if name in LISTS:
+            values = self.columns[name]
+            if mask is not None:
+                values = values[np.repeat(mask, self._lengths(name))]
+            ids = self.dictionaries[LISTS[name]].ids
+        else:
+            values = self.columns[name] if mask is None else self.columns[name][mask]
+            ids = self.dictionaries[REFS[name]].ids if name in REFS else None
+        if ids is None:
+            keys, counts = np.unique(values, return_counts=True)
+            return dict(zip(keys.tolist(), counts.tolist()))
+        counts = np.bincount(values[values >= 0], minlength=len(ids))
+        return dict((ids[code], int(count)) for code, count in enumerate(counts) if count)
+
+    def deadline_buckets(self, mask=None, now=None, utc_offset=0):
+        """Number of the active tasks of mask by deadline: late, today,
+           this_week (after today), later and none.
+
+           The days start at midnight utc_offset seconds from UTC.
+        """
+        now = now or time.time()
+        today, week_end = _day_and_week(now, utc_offset)
+        deadline = self.columns['deadline']
+        active = self.active() if mask is None else self.active() & mask
+        has_deadline = deadline != NO_DATE
+        return {
+            'none': int(np.count_nonzero(active & ~has_deadline)),
+            'late': int(np.count_nonzero(active & has_deadline & (deadline < now))),
+            'today': int(np.count_nonzero(active & (deadline >= now) & (deadline < today + 86400))),
+            'this_week': int(np.count_nonzero(active & (deadline >= max(now, today + 86400)) & (deadline < week_end))),
+            'later': int(np.count_nonzero(active & (deadline >= week_end))),
+        }
+
+    def alias_counts(self, user_id, now=None, utc_offset=0):
+        """Number of tasks for each alias of Producteev.search_tasks() from
+           the point of view of user_id, like get_tasks_alias_counts().
+
+           The starred and files aliases are not counted, the tasks do
+           not tell it.
+        """
+        now = now or time.time()
+        today, week_end = _day_and_week(now, utc_offset)
+        users = self.dictionaries['users'].lookup([user_id])
+        present = ~self.columns['deleted']
+        active = self.active()
+        count = lambda mask: int(np.count_nonzero(mask))
+        return {
+            'all': count(present),
+            'activeandcompleted': count(present),
+            'active': count(active),
+            'completed': count(present & ~active),
+            'created': count(active & np.in1d(self.columns['creator'], users)),
+            'responsible': count(active & self._any('responsibles', users)),
+            'following': count(active & self._any('followers', users)),
+            'late': count(self.late(now)),
+            'duetoday': count(self.due_between(today, today + 86400)),
+            'duethisweek': count(self.due_between(today, week_end)),
+        }
+
+
+def _day_and_week(now, utc_offset=0):
+    """Timestamps of the start of the day of now and of the end of its
+       week (next Monday)
+    """
+    local = time.gmtime(now + utc_offset)
+    today = calendar.timegm(local[:3] + (0, 0, 0) + local[6:]) - utc_offset
+    return today, today + 86400 * (7 - local.tm_wday)
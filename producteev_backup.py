@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+
+Copyright © 2014 François Bianco <francois.bianco@skadi.ch>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+See COPYING file for the full license.
+
+"""
+
+import hashlib
+import httplib
+import os
+import threading
+
+from producteev import ProducteevError, bounded_map, download_size
+from producteev_sync import _JsonLog
+
+
+class AttachmentBackup():
+    """Backup the files attached to the notes of Producteev tasks
+
+       Files are downloaded concurrently by a pool of workers threads and
+       streamed to disk by chunks. A manifest (file id, size, sha1) is kept
+       in the backup directory, so a new run skips the files already fetched
+       and resumes the partial downloads with a Range request.
+
+       Each downloaded file is appended to the JOURNAL (one JSON entry per
+       line), which is merged into the MANIFEST at the end of run(), see
+       compact().
+
+       Example:
+           backup = AttachmentBackup(Producteev(), 'producteev_backups')
+           backup.run({"statuses":[0, 1]})
+    """
+
+    MANIFEST = 'manifest.json'
+    JOURNAL = 'manifest.jsonl'
+
+    def __init__(self, api, directory, workers=4, chunk_size=65536):
+        self.api = api
+        self.directory = directory
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+
+        try:
+            os.makedirs(directory)
+        except OSError:
+            pass
+        self.log = _JsonLog(os.path.join(directory, self.MANIFEST), os.path.join(directory, self.JOURNAL))
+        self.manifest = self.log.load({})
+        for file_id, entry in self.log.replay():
+            self.manifest[file_id] = entry
+
+    def _journal(self, file_id, entry):
+        """Append a manifest entry to the journal, must be called with the
+           lock held
+        """
+        self.log.append([[file_id, entry]])
+
+    def compact(self):
+        """Write the manifest atomically and empty the journal"""
+        with self._lock:
+            self.log.compact(self.manifest)
+
+    def path(self, file_obj):
+        """Local path of a file, prefixed by its id to avoid collisions"""
+        title = os.path.basename(file_obj['title']) or 'file'
+        return os.path.join(self.directory, u'{0}_{1}'.format(file_obj['id'], title))
+
+    def iter_files(self, criteria='', filters={'alias':'files','sort':'created_at','order':'desc'}):
+        """Iterate over the files attached to the notes of the tasks
+           matching criteria and filters (see Producteev.export_tasks()).
+        """
+        get_notes = lambda task: self.api.get_task_notes(task['id'])
+        tasks = self.api.iter_search_tasks(criteria, filters, prefetch=True)
+        for task, notes_list, exc_info in bounded_map(get_notes, tasks, self.workers):
+            if exc_info is not None:
+                raise exc_info[0], exc_info[1], exc_info[2]
+            for note in (notes_list or {}).get('notes') or []:
+                for file_obj in note.get('files') or []:
+                    yield file_obj
+
+    def done(self, file_obj):
+        """True if the file was already completely downloaded"""
+        entry = self.manifest.get(file_obj['id'])
+        return entry is not None and entry.get('complete') \
+               and os.path.exists(entry['path']) \
+               and os.path.getsize(entry['path']) == entry['size']
+
+    def fetch(self, file_obj):
+        """Download a file, resuming a previous partial download
+
+           The .part file is only renamed once its size is the one sent by
+           the server, a ProducteevError is raised when the connection is
+           closed before, to resume the download on the next run.
+        """
+        path = self.path(file_obj)
+        part = path + '.part'
+        sha1 = hashlib.sha1()
+        offset = 0
+        if os.path.exists(part):
+            with open(part, 'rb') as f:
+                for chunk in iter(lambda: f.read(self.chunk_size), ''):
+                    sha1.update(chunk)
+                    offset += len(chunk)
+
+        headers = {'Range': 'bytes={0}-'.format(offset)} if offset else None
+        r = self.api.open_url(file_obj['url'], headers, accept=(416,) if offset else ())
+        try:
+            size = download_size(r)
+            if 416 == r.status:
+                # Nothing left after offset: complete unless the file changed
+                r.read()
+                if size != offset:
+                    os.remove(part)
+                    raise ProducteevError, "Can not resume {0} at {1} bytes of {2}".format(path, offset, size)
+            else:
+                with open(part, 'ab') as f:
+                    if offset and 206 != r.status:
+                        # Range ignored, the whole file is sent again
+                        f.seek(0)
+                        f.truncate()
+                        sha1 = hashlib.sha1()
+                        offset = 0
+                    for chunk in iter(lambda: r.read(self.chunk_size), ''):
+                        f.write(chunk)
+                        sha1.update(chunk)
+                        offset += len(chunk)
+                if size is not None and offset != size:
+                    raise ProducteevError, "Download of {0} cut at {1} bytes of {2}".format(path, offset, size)
+        finally:
+            r.close()
+
+        os.rename(part, path)
+        with self._lock:
+            entry = self.manifest[file_obj['id']] = {
+                'title': file_obj['title'],
+                'path': path,
+                'size': offset,
+                'sha1': sha1.hexdigest(),
+                'complete': True,
+            }
+            self._journal(file_obj['id'], entry)
+        return path
+
+    def run(self, criteria='', filters={'alias':'files','sort':'created_at','order':'desc'}):
+        """Download all the files not yet backuped of the tasks matching
+           criteria and filters.
+
+           Return a dictionary counting the files downloaded, skipped and
+           failed, the errors are listed by file id under 'errors'.
+        """
+        stats = {'downloaded': 0, 'skipped': 0, 'failed': 0, 'errors': {}}
+        seen = set()
+        def todo():
+            for file_obj in self.iter_files(criteria, filters):
+                if file_obj['id'] in seen or self.done(file_obj):
+                    stats['skipped'] += 1
+                else:
+                    seen.add(file_obj['id'])
+                    yield file_obj
+
+        try:
+            for file_obj, path, exc_info in bounded_map(self.fetch, todo(), self.workers, ordered=False):
+                if exc_info is None:
+                    stats['downloaded'] += 1
+                elif issubclass(exc_info[0], (ProducteevError, EnvironmentError, httplib.HTTPException)):
+                    stats['failed'] += 1
+                    stats['errors'][file_obj['id']] = exc_info[1]
+                else:
+                    raise exc_info[0], exc_info[1], exc_info[2]
+        finally:
+            self.compact()
+        return stats
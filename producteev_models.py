@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+
+Copyright © 2014 François Bianco <francois.bianco@skadi.ch>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+See COPYING file for the full license.
+
+"""
+
+import weakref
+
+
+class Model(object):
+    """Compact object built from a Producteev JSON object
+
+       The FIELDS are stored in __slots__. The NESTED objects (and
+       NESTED_LISTS of objects) are only decoded into models when first
+       accessed, except when the model of the same id is already known by
+       the registry. Until then, the JSON objects of the interned classes
+       are interned too. Other keys are kept as is in the extra dictionary.
+
+       Users, labels, projects and networks are interned by id in the
+       Registry, so the same object is shared by all the tasks refering
+       to it.
+    """
+
+    __slots__ = ('_registry', '_pending', 'extra', '__weakref__')
+    FIELDS = ()
+    NESTED = {}
+    NESTED_LISTS = {}
+    INTERNED = False
+
+    def __init__(self, data, registry):
+        self._registry = registry
+        self._pending = None
+        self.extra = None
+        for key, value in data.iteritems():
+            if key in self.NESTED or key in self.NESTED_LISTS:
+                decoded = registry.known(self._model(key), value)
+                if decoded is not None:
+                    setattr(self, key, decoded)
+                else:
+                    if self._pending is None:
+                        self._pending = {}
+                    self._pending[key] = registry.intern_json(self._model(key), value)
+            elif key in self.FIELDS:
+                setattr(self, key, value)
+            else:
+                if self.extra is None:
+                    self.extra = {}
+                self.extra[key] = value
+
+    def _model(self, key):
+        if key in self.NESTED:
+            return MODELS[self.NESTED[key]]
+        return [MODELS[self.NESTED_LISTS[key]]]
+
+    def __getattr__(self, name):
+        # Only called for unset slots or unknown attributes
+        if name in self.FIELDS:
+            return None
+        if name in self.NESTED or name in self.NESTED_LISTS:
+            value = (self._pending or {}).pop(name, None)
+            decoded = self._registry.decode(self._model(name), value)
+            setattr(self, name, decoded)
+            return decoded
+        if self.extra is not None and name in self.extra:
+            return self.extra[name]
+        raise AttributeError(name)
+
+    def __repr__(self):
+        return '<{0} {1}>'.format(self.__class__.__name__, getattr(self, 'id', '?'))
+
+    def to_dict(self):
+        """Return the JSON object of the model"""
+        data = dict(self.extra or {})
+        for key in self.FIELDS:
+            try:
+                data[key] = object.__getattribute__(self, key)
+            except AttributeError:
+                pass
+        for key in self.NESTED.keys() + self.NESTED_LISTS.keys():
+            if key in (self._pending or {}):
+                data[key] = self._pending[key]
+                continue
+            try:
+                value = object.__getattribute__(self, key)
+            except AttributeError:
+                continue
+            if isinstance(value, list):
+                data[key] = [obj.to_dict() for obj in value]
+            elif value is not None:
+                data[key] = value.to_dict()
+        return data
+
+
+class Network(Model):
+    __slots__ = ('id', 'title')
+    FIELDS = __slots__
+    INTERNED = True
+
+class User(Model):
+    __slots__ = ('id', 'email', 'firstname', 'lastname', 'avatar_path', 'timezone', 'lang')
+    FIELDS = __slots__
+    INTERNED = True
+
+class Label(Model):
+    __slots__ = ('id', 'title', 'foreground_color', 'background_color', 'network')
+    FIELDS = __slots__[:-1]
+    NESTED = {'network': 'Network'}
+    INTERNED = True
+
+class Project(Model):
+    __slots__ = ('id', 'title', 'description', 'restricted', 'locked',
+                 'created_at', 'updated_at', 'network', 'creator')
+    FIELDS = __slots__[:-2]
+    NESTED = {'network': 'Network', 'creator': 'User'}
+    INTERNED = True
+
+class Subtask(Model):
+    __slots__ = ('id', 'title', 'status', 'position', 'created_at', 'updated_at')
+    FIELDS = __slots__
+
+class Task(Model):
+    __slots__ = ('id', 'title', 'status', 'priority', 'deadline', 'all_day',
+                 'created_at', 'updated_at', 'deleted_at', 'notes_count',
+                 'project', 'creator', 'responsibles', 'followers', 'labels', 'subtasks')
+    FIELDS = __slots__[:-6]
+    NESTED = {'project': 'Project', 'creator': 'User'}
+    NESTED_LISTS = {'responsibles': 'User', 'followers': 'User', 'labels': 'Label', 'subtasks': 'Subtask'}
+
+class Note(Model):
+    __slots__ = ('id', 'message', 'files', 'created_at', 'updated_at', 'creator', 'task')
+    FIELDS = __slots__[:-2]
+    NESTED = {'creator': 'User', 'task': 'Task'}
+
+MODELS = dict((cls.__name__, cls) for cls in (Network, User, Label, Project, Subtask, Task, Note))
+
+
+class Registry(object):
+    """Build models from JSON objects, interning the models of the
+       INTERNED classes by id.
+
+       Interned models are held weakly, they are freed once no task refers
+       to them anymore. The first JSON object seen for an id is kept, until
+       its model is decoded.
+
+       Example:
+           models = Registry()
+           for task in models.wrap(p.iter_search_tasks()):
+               print task.title, task.project.title
+    """
+
+    def __init__(self):
+        self._objects = dict((cls, weakref.WeakValueDictionary())
+                             for cls in MODELS.values() if cls.INTERNED)
+        self._json = dict((cls, {}) for cls in self._objects)
+
+    def known(self, model, value):
+        """Return the already interned model(s) for the JSON value, or
+           None if one of them must be decoded
+        """
+        if isinstance(model, list):
+            if not value:
+                return value
+            objects = [self.known(model[0], data) for data in value]
+            return None if None in objects else objects
+        if model.INTERNED and isinstance(value, dict) and 'id' in value:
+            return self._objects[model].get(value['id'])
+        return None
+
+    def intern_json(self, model, value):
+        """Return the JSON value with the objects of the interned classes
+           replaced by the first one seen with the same id
+        """
+        if isinstance(model, list):
+            return [self.intern_json(model[0], data) for data in value] if value else value
+        if model.INTERNED and isinstance(value, dict) and 'id' in value:
+            return self._json[model].setdefault(value['id'], value)
+        return value
+
+    def decode(self, model, value):
+        """Return the model (or list of models) of the JSON value"""
+        if isinstance(model, list):
+            return [self.decode(model[0], data) for data in value or []]
+        if value is None:
+            return None
+        if model.INTERNED and 'id' in value:
+            obj = self._objects[model].get(value['id'])
+            if obj is None:
+                obj = model(self._json[model].pop(value['id'], value), self)
+                self._objects[model][value['id']] = obj
+            return obj
+        return model(value, self)
+
+    def task(self, data): return self.decode(Task, data)
+    def project(self, data): return self.decode(Project, data)
+    def user(self, data): return self.decode(User, data)
+    def label(self, data): return self.decode(Label, data)
+    def network(self, data): return self.decode(Network, data)
+    def note(self, data): return self.decode(Note, data)
+
+    def wrap(self, objects, model=Task):
+        """Generator decoding JSON objects, e.g. from Producteev iterators"""
+        for data in objects:
+            yield self.decode(model, data)
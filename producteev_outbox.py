@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+
+Copyright © 2014 François Bianco <francois.bianco@skadi.ch>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+See COPYING file for the full license.
+
+"""
+
+import httplib
+import inspect
+import sqlite3
+import threading
+from collections import Counter, deque, OrderedDict
+
+import httplib2
+import simplejson as json
+from oauth2client.client import AccessTokenRefreshError
+
+import producteev
+from producteev import ProducteevError, ProducteevBadRequest, ProducteevAccessDenied, \
+                       ProducteevNotFound, ProducteevConflict, ProducteevNotImplemented
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    resource TEXT,
+    operation TEXT,
+    args TEXT,
+    error TEXT
+);
+"""
+
+"""Mutations which can be journaled, and the ones sent through a Batch"""
+OPERATIONS = ('create_task', 'update_task', 'delete_task', 'create_note',
+              'add_task_label', 'delete_task_label',
+              'add_task_responsible', 'delete_task_responsible',
+              'add_task_follower', 'delete_task_follower')
+BATCHED = ('update_task', 'delete_task', 'add_task_label', 'add_task_responsible')
+
+"""Errors which will not succeed by sending the mutation again"""
+PERMANENT_ERRORS = (ProducteevBadRequest, ProducteevAccessDenied, ProducteevNotFound,
+                    ProducteevConflict, ProducteevNotImplemented)
+
+"""Errors of the API or of the connection, which may not happen again
+(but PERMANENT_ERRORS). Any other error (e.g. a TypeError of the
+arguments) is permanent too."""
+TEMPORARY_ERRORS = (ProducteevError, EnvironmentError, httplib.HTTPException,
+                    httplib2.HttpLib2Error, AccessTokenRefreshError)
+
+
+def permanent(error):
+    """Whether sending again the mutation which raised error will fail too"""
+    return isinstance(error, PERMANENT_ERRORS) or not isinstance(error, TEMPORARY_ERRORS)
+
+
+class Outbox(object):
+    """Durable write-behind journal of the task mutations
+
+       The mutations of OPERATIONS are called on the outbox with the
+       arguments of the Producteev methods. They are appended to a SQLite
+       journal at path and return at once their sequence number, while a
+       background thread (see start()) replays them every interval seconds.
+
+       The mutations of a task are sent in their order: each round of a
+       flush() sends the oldest pending mutation of every task, those of
+       BATCHED through a Batch of batch_size tasks. Consecutive
+       update_task() of a task are coalesced into one.
+
+       A mutation failing with a permanent error (see permanent()) is kept
+       in the journal with its error (see failed()), the next mutations of
+       the task are sent. When a batched chunk fails with such an error,
+       its mutations are sent again one by one to find the failing ones.
+       Other errors (e.g. the API is unavailable) stop the task mutations
+       until the next flush, the flusher then waits twice longer, up to
+       max_interval seconds.
+
+       A mutation is removed from the journal once sent, so it may be sent
+       again if the process dies in between.
+
+       Example:
+           with Outbox(Producteev(), 'outbox.db') as outbox:
+               outbox.update_task(task_id, title='New title')
+               outbox.add_task_label(task_id, label_id)
+    """
+
+    def __init__(self, api, path='producteev_outbox.db', interval=1.0, batch_size=50, max_interval=60):
+        self.api = api
+        self.path = path
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_interval = max_interval
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        # The WAL journal survives a crash of the process, and is faster to append
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.thread = None
+
+    def __getattr__(self, name):
+        if name not in OPERATIONS:
+            raise AttributeError(name)
+        def append(*args, **kwargs):
+            return self.append(name, *args, **kwargs)
+        append.__name__ = name
+        append.__doc__ = getattr(self.api, name).__doc__
+        return append
+
+    def append(self, operation, *args, **kwargs):
+        """Journal the call of the Producteev method operation with args
+           and kwargs, and return its sequence number
+        """
+        if operation not in OPERATIONS:
+            raise ValueError, "Not a journaled operation: %s" % operation
+        # Raise TypeError now rather than when replayed
+        kwargs = self._keywords(operation, args, kwargs)
+        task_id = kwargs.get('task_id')
+        resource = None if task_id is None else 'task:' + task_id
+        with self.lock:
+            cursor = self.db.execute('INSERT INTO outbox (resource, operation, args) VALUES (?, ?, ?)',
+                                     (resource, operation, json.dumps([[], kwargs])))
+            self.db.commit()
+        return cursor.lastrowid
+
+    def _keywords(self, operation, args, kwargs):
+        """The arguments of a call of operation as keyword arguments only,
+           so that the calls of a task have the same shape when coalesced
+        """
+        method = getattr(self.api, operation)
+        spec = inspect.getargspec(method)
+        callargs = inspect.getcallargs(method, *args, **kwargs)
+        del callargs[spec.args[0]] # self
+        if spec.keywords is not None:
+            callargs.update(callargs.pop(spec.keywords))
+        return callargs
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM outbox WHERE error IS NULL').fetchone()[0]
+
+    def failed(self):
+        """List of the (seq, operation, args, kwargs, error) mutations which
+           failed with a permanent error
+        """
+        with self.lock:
+            rows = self.db.execute('SELECT seq, operation, args, error FROM outbox '
+                                   'WHERE error IS NOT NULL ORDER BY seq').fetchall()
+        return [(seq, operation) + tuple(json.loads(args)) + (error,) for seq, operation, args, error in rows]
+
+    # Replay
+    def _pending(self):
+        """Pending mutations queued by resource, with the updates coalesced"""
+        with self.lock:
+            rows = self.db.execute('SELECT seq, resource, operation, args FROM outbox '
+                                   'WHERE error IS NULL ORDER BY seq').fetchall()
+        queues = OrderedDict()
+        coalesced = 0
+        for seq, resource, operation, args in rows:
+            args, kwargs = json.loads(args)
+            mutation = {'seqs': [seq], 'operation': operation, 'args': [], 'kwargs': kwargs, 'error': None}
+            try: # rows journaled by older versions have positional arguments
+                mutation['kwargs'] = self._keywords(operation, args, kwargs)
+            except Exception, e:
+                mutation.update(args=args, error=e)
+            queue = queues.setdefault(resource or 'seq:{0}'.format(seq), deque())
+            last = queue[-1] if queue else None
+            if ('update_task' == operation and last is not None and 'update_task' == last['operation']
+                    and mutation['error'] is None and last['error'] is None):
+                last['kwargs'].update(mutation['kwargs'])
+                last['seqs'].append(seq)
+                coalesced += 1
+                continue
+            queue.append(mutation)
+        return queues, coalesced
+
+    def _call(self, mutation):
+        method = getattr(self.api, mutation['operation'])
+        return method(*mutation['args'], **mutation['kwargs'])
+
+    def _send_round(self, mutations):
+        """Send one mutation of each resource, return the error of each
+           resource (None if sent)
+        """
+        errors = OrderedDict()
+        for resource, mutation in mutations:
+            if mutation['error'] is not None:
+                errors[resource] = mutation['error']
+        mutations = [(resource, m) for resource, m in mutations if resource not in errors]
+        batched = [(resource, m) for resource, m in mutations if m['operation'] in BATCHED]
+        if batched:
+            batch = self.api.batch(self.batch_size)
+            failure = None
+            try:
+                with batch:
+                    for resource, mutation in batched:
+                        try:
+                            self._call(mutation)
+                        except Exception, e: # not queued, the others still are
+                            errors[resource] = e
+            except Exception, e: # the chunks not sent yet get this error
+                failure = e
+            sent = dict(('task:' + task['id'], error) for operation, target, task, result, error in batch.results)
+            for resource, mutation in batched:
+                if resource not in errors:
+                    errors[resource] = sent[resource] if resource in sent else failure
+            # An error of a whole chunk may come from only one of its mutations
+            shared = Counter(id(error) for error in errors.values() if error is not None)
+            for resource, mutation in batched:
+                error = errors[resource]
+                if error is not None and permanent(error) and shared[id(error)] > 1:
+                    try:
+                        self._call(mutation)
+                        errors[resource] = None
+                    except Exception, e:
+                        errors[resource] = e
+
+        for resource, mutation in mutations:
+            if mutation['operation'] in BATCHED:
+                continue
+            try:
+                self._call(mutation)
+                errors[resource] = None
+            except Exception, e:
+                errors[resource] = e
+        return errors
+
+    def flush(self):
+        """Send the pending mutations, and return the number of mutations
+           sent, coalesced, failed and left to retry as a dictionary
+        """
+        with self.flush_lock:
+            queues, coalesced = self._pending()
+            stats = {'sent': 0, 'coalesced': coalesced, 'failed': 0, 'retry': 0}
+            while queues:
+                mutations = [(resource, queue[0]) for resource, queue in queues.items()]
+                for resource, error in self._send_round(mutations).items():
+                    queue = queues[resource]
+                    if error is not None and not permanent(error):
+                        stats['retry'] += sum(len(m['seqs']) for m in queue)
+                        del queues[resource]
+                        continue
+                    mutation = queue.popleft()
+                    if not queue:
+                        del queues[resource]
+                    marks = ', '.join('?' * len(mutation['seqs']))
+                    with self.lock:
+                        if error is None:
+                            self.db.execute('DELETE FROM outbox WHERE seq IN ({0})'.format(marks), mutation['seqs'])
+                            stats['sent'] += 1
+                        else:
+                            self.db.execute('UPDATE outbox SET error = ? WHERE seq IN ({0})'.format(marks),
+                                            [repr(error)] + mutation['seqs'])
+                            stats['failed'] += 1
+                        self.db.commit()
+            return stats
+
+    # Background flusher
+    def _run(self):
+        delay = self.interval
+        while True:
+            self.wakeup.wait(delay)
+            self.wakeup.clear()
+            if self.stopping:
+                return
+            try:
+                stats = self.flush()
+            except Exception, e:
+                if producteev.DEBUG: print 'ERROR: outbox flush failled', e
+                stats = None
+            if stats is not None and not stats['retry']:
+                delay = self.interval
+            else:
+                delay = min(2 * delay, self.max_interval)
+
+    def start(self):
+        """Replay the journal in a background thread"""
+        self.stopping = False
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self, flush=True):
+        """Stop the background thread, and send the pending mutations once
+           more if flush is True
+        """
+        if self.thread is not None:
+            self.stopping = True
+            self.wakeup.set()
+            self.thread.join()
+            self.thread = None
+        if flush:
+            return self.flush()
+
+    def close(self):
+        self.stop(flush=False)
+        self.db.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+
+Copyright © 2014 François Bianco <francois.bianco@skadi.ch>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+See COPYING file for the full license.
+
+"""
+
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+
+def normalize(name):
+    """Case-insensitive key of a name or email"""
+    if isinstance(name, str):
+        name = name.decode('utf-8')
+    return u' '.join((name or u'').lower().split())
+
+"""Names under which the objects of each kind can be looked up"""
+KEYS = {
+    'labels': lambda label: [label.get('title')],
+    'projects': lambda project: [project.get('title')],
+    'users': lambda user: [user.get('email'),
+                           u'{0} {1}'.format(user.get('firstname') or '', user.get('lastname') or '')],
+}
+
+"""Method listing the objects of each kind of a network"""
+LOADERS = {
+    'labels': 'iter_network_labels',
+    'projects': 'iter_network_projects',
+    'users': 'iter_network_users',
+}
+
+
+class Index(object):
+    """Sorted array of the normalized names of objects, looked up by
+       bisection for exact names or prefixes
+    """
+
+    def __init__(self, objects, keys):
+        entries = sorted((normalize(key), i) for i, obj in enumerate(objects)
+                         for key in keys(obj) if normalize(key))
+        self.names = [name for name, i in entries]
+        self.objects = [objects[i] for name, i in entries]
+        self.loaded_at = time.time()
+
+    def _unique(self, lo, hi):
+        found = OrderedDict()
+        for obj in self.objects[lo:hi]:
+            found.setdefault(obj['id'], obj)
+        return found.values()
+
+    def exact(self, name):
+        name = normalize(name)
+        return self._unique(bisect_left(self.names, name), bisect_right(self.names, name))
+
+    def prefix(self, prefix):
+        prefix = normalize(prefix)
+        return self._unique(bisect_left(self.names, prefix), bisect_left(self.names, prefix + u'\uffff'))
+
+
+class NameResolver():
+    """Resolve the names of labels, projects and users (title, email or
+       full name) to their ids locally.
+
+       All the labels, projects or users of a network are loaded at once
+       through the paginated endpoints, on the first lookup of their kind,
+       and indexed case-insensitively. Each (network, kind) index is loaded
+       again on the next lookup once older than ttl seconds, or when a name
+       is not found and the index is older than miss_ttl seconds (e.g. a
+       label created since). There is no incremental refresh: all the
+       objects of this kind of the network are loaded again.
+
+       An index is loaded by one thread at once, the other threads keep
+       looking up the previous index meanwhile, if any.
+
+       network_ids are the networks to look into, by default all the
+       networks of the user.
+
+       Example:
+           names = NameResolver(Producteev())
+           label_id = names.label_id('Urgent')
+           user_id = names.user_id('john@example.com')
+    """
+
+    def __init__(self, api, network_ids=None, ttl=3600, miss_ttl=60):
+        self.api = api
+        self._network_ids = network_ids
+        self.ttl = ttl
+        self.miss_ttl = miss_ttl
+        self.indexes = {} # (network_id, kind) -> Index
+        self.locks = {} # (network_id, kind) -> Lock held while loading
+        self.lock = threading.Lock()
+
+    @property
+    def network_ids(self):
+        if self._network_ids is None:
+            self._network_ids = [network['id'] for network in self.api.iter_networks(prefetch=True)]
+        return self._network_ids
+
+    def load(self, network_id, kind):
+        """(Re)load the index of all the objects of kind of the network"""
+        objects = list(getattr(self.api, LOADERS[kind])(network_id, prefetch=True))
+        index = self.indexes[(network_id, kind)] = Index(objects, KEYS[kind])
+        return index
+
+    def _index(self, network_id, kind, max_age):
+        key = (network_id, kind)
+        index = self.indexes.get(key)
+        if index is not None and time.time() - index.loaded_at <= max_age:
+            return index
+        with self.lock:
+            lock = self.locks.setdefault(key, threading.Lock())
+        if index is None:
+            lock.acquire()
+        elif not lock.acquire(False):
+            return index # being reloaded by another thread
+        try:
+            index = self.indexes.get(key)
+            if index is not None and time.time() - index.loaded_at <= max_age:
+                return index # loaded by another thread meanwhile
+            return self.load(network_id, kind)
+        finally:
+            lock.release()
+
+    def _find(self, kind, network_id, lookup):
+        network_ids = [network_id] if network_id is not None else self.network_ids
+        found = []
+        for network_id in network_ids:
+            found.extend(lookup(self._index(network_id, kind, self.ttl)))
+        if not found and self.miss_ttl is not None:
+            for network_id in network_ids:
+                found.extend(lookup(self._index(network_id, kind, self.miss_ttl)))
+        return found
+
+    def find(self, kind, name, network_id=None):
+        """List of the objects of kind (labels, projects or users) with
+           the given name, in the network or in all the networks
+        """
+        return self._find(kind, network_id, lambda index: index.exact(name))
+
+    def complete(self, kind, prefix, network_id=None, limit=10):
+        """List of at most limit objects of kind with a name starting with
+           prefix
+        """
+        return self._find(kind, network_id, lambda index: index.prefix(prefix))[:limit]
+
+    def resolve(self, kind, name, network_id=None):
+        """Id of the object of kind with the given name, None if there is
+           none. Raise ValueError if several objects have this name.
+        """
+        found = dict((obj['id'], obj) for obj in self.find(kind, name, network_id))
+        if len(found) > 1:
+            raise ValueError, "Ambiguous %s name: %s" % (kind, name)
+        return found.keys()[0] if found else None
+
+    def label_id(self, title, network_id=None): return self.resolve('labels', title, network_id)
+    def project_id(self, title, network_id=None): return self.resolve('projects', title, network_id)
+    def user_id(self, name, network_id=None): return self.resolve('users', name, network_id)
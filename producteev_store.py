@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+
+Copyright © 2014 François Bianco <francois.bianco@skadi.ch>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+See COPYING file for the full license.
+
+"""
+
+import sqlite3
+
+import simplejson as json
+
+from producteev_sync import timestamp
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    network_id TEXT,
+    project_id TEXT,
+    creator_id TEXT,
+    status INTEGER,
+    priority INTEGER,
+    deadline INTEGER,
+    created_at INTEGER,
+    updated_at INTEGER,
+    title TEXT,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS tasks_network ON tasks (network_id);
+CREATE INDEX IF NOT EXISTS tasks_project ON tasks (project_id);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status);
+CREATE INDEX IF NOT EXISTS tasks_priority ON tasks (priority);
+CREATE INDEX IF NOT EXISTS tasks_deadline ON tasks (deadline);
+CREATE INDEX IF NOT EXISTS tasks_updated_at ON tasks (updated_at);
+
+CREATE TABLE IF NOT EXISTS task_responsibles (task_id TEXT, user_id TEXT, PRIMARY KEY (user_id, task_id));
+CREATE TABLE IF NOT EXISTS task_followers (task_id TEXT, user_id TEXT, PRIMARY KEY (user_id, task_id));
+CREATE TABLE IF NOT EXISTS task_labels (task_id TEXT, label_id TEXT, PRIMARY KEY (label_id, task_id));
+CREATE INDEX IF NOT EXISTS task_responsibles_task ON task_responsibles (task_id);
+CREATE INDEX IF NOT EXISTS task_followers_task ON task_followers (task_id);
+CREATE INDEX IF NOT EXISTS task_labels_task ON task_labels (task_id);
+
+CREATE TABLE IF NOT EXISTS projects (id TEXT PRIMARY KEY, network_id TEXT, title TEXT, data TEXT);
+CREATE TABLE IF NOT EXISTS labels (id TEXT PRIMARY KEY, network_id TEXT, title TEXT, data TEXT);
+CREATE TABLE IF NOT EXISTS users (id TEXT PRIMARY KEY, email TEXT, data TEXT);
+"""
+
+"""Links between a task and lists of objects: (table, column, task key, criteria key)"""
+LINKS = [
+    ('task_responsibles', 'user_id', 'responsibles', 'responsibles'),
+    ('task_followers', 'user_id', 'followers', 'followers'),
+    ('task_labels', 'label_id', 'labels', 'labels'),
+]
+
+"""Task columns by search criteria key, and by sort filter"""
+COLUMNS = {'networks': 'network_id', 'projects': 'project_id', 'creators': 'creator_id',
+           'statuses': 'status', 'priorities': 'priority'}
+RANGES = {'deadline': 'deadline', 'created_at': 'created_at', 'updated_at': 'updated_at'}
+SORTS = {'created_at': 'created_at', 'updated_at': 'updated_at', 'project': 'project_id',
+         'creator': 'creator_id', 'deadline_time': 'deadline', 'priority': 'priority',
+         'status': 'status', 'title': 'title'}
+
+
+def _id(obj):
+    return (obj or {}).get('id')
+
+
+class SQLiteTaskStore():
+    """Local replica of tasks, projects, labels and users in SQLite
+
+       Tasks are indexed on network, project, status, priority, deadline,
+       responsibles, followers and labels, so query() answers locally the
+       search criteria of Producteev.search_tasks(). The project, labels
+       and users of a stored task are stored too.
+
+       It has the store interface of producteev_sync.JsonTaskStore and can
+       be fed by producteev_sync.TaskSync. path may be ':memory:'.
+    """
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    # Store interface
+    def put(self, task):
+        project = task.get('project') or {}
+        network_id = _id(task.get('network')) or _id(project.get('network'))
+        self.delete(task['id'])
+        self.db.execute('INSERT INTO tasks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (
+            task['id'], network_id, _id(project), _id(task.get('creator')),
+            task.get('status'), task.get('priority'),
+            timestamp(task.get('deadline')), timestamp(task.get('created_at')),
+            timestamp(task.get('updated_at')), task.get('title'), json.dumps(task)))
+        for table, column, key, criteria_key in LINKS:
+            self.db.executemany('INSERT OR IGNORE INTO {0} (task_id, {1}) VALUES (?, ?)'.format(table, column),
+                                [(task['id'], _id(obj)) for obj in task.get(key) or [] if _id(obj)])
+        if _id(project):
+            self.put_project(project)
+        for label in task.get('labels') or []:
+            if _id(label):
+                self.put_label(label)
+        for user in [task.get('creator')] + (task.get('responsibles') or []) + (task.get('followers') or []):
+            if _id(user):
+                self.put_user(user)
+
+    def delete(self, task_id):
+        self.db.execute('DELETE FROM tasks WHERE id = ?', (task_id,))
+        for table, column, key, criteria_key in LINKS:
+            self.db.execute('DELETE FROM {0} WHERE task_id = ?'.format(table), (task_id,))
+
+    def get(self, task_id):
+        row = self.db.execute('SELECT data FROM tasks WHERE id = ?', (task_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM tasks').fetchone()[0]
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    # Other objects
+    def put_project(self, project):
+        self.db.execute('INSERT OR REPLACE INTO projects VALUES (?, ?, ?, ?)',
+                        (project['id'], _id(project.get('network')), project.get('title'), json.dumps(project)))
+
+    def put_label(self, label):
+        self.db.execute('INSERT OR REPLACE INTO labels VALUES (?, ?, ?, ?)',
+                        (label['id'], _id(label.get('network')), label.get('title'), json.dumps(label)))
+
+    def put_user(self, user):
+        self.db.execute('INSERT OR REPLACE INTO users VALUES (?, ?, ?)',
+                        (user['id'], user.get('email'), json.dumps(user)))
+
+    def _get(self, table, object_id):
+        row = self.db.execute('SELECT data FROM {0} WHERE id = ?'.format(table), (object_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_project(self, project_id): return self._get('projects', project_id)
+    def get_label(self, label_id): return self._get('labels', label_id)
+    def get_user(self, user_id): return self._get('users', user_id)
+
+    # Queries
+    def _where(self, criteria):
+        """SQL condition and parameters matching the search criteria"""
+        conditions = []
+        params = []
+        for key, column in COLUMNS.items():
+            values = criteria.get(key)
+            if values:
+                conditions.append('{0} IN ({1})'.format(column, ', '.join('?' * len(values))))
+                params.extend(values)
+        for table, column, key, criteria_key in LINKS:
+            values = criteria.get(criteria_key)
+            if values:
+                conditions.append('id IN (SELECT task_id FROM {0} WHERE {1} IN ({2}))'.format(
+                                  table, column, ', '.join('?' * len(values))))
+                params.extend(values)
+        for key, column in RANGES.items():
+            bounds = criteria.get(key) or {}
+            if bounds.get('from') is not None:
+                conditions.append('{0} >= ?'.format(column))
+                params.append(timestamp(bounds['from']))
+            if bounds.get('to') is not None:
+                conditions.append('{0} <= ?'.format(column))
+                params.append(timestamp(bounds['to']))
+        text = (criteria.get('search') or {}).get('text')
+        if text:
+            conditions.append("title LIKE ? ESCAPE '\\'")
+            params.append('%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        return ' AND '.join(conditions) or '1', params
+
+    def query(self, criteria=None, filters={'sort':'created_at','order':'desc'}, page=None, per_page=50):
+        """Return the list of the stored tasks matching criteria, sorted
+           by filters, see Producteev.search_tasks() for their format.
+
+           If page is given, only this page of per_page tasks is returned.
+        """
+        where, params = self._where(criteria or {})
+        sort = SORTS.get(filters.get('sort'), 'created_at')
+        order = 'ASC' if 'asc' == filters.get('order') else 'DESC'
+        sql = 'SELECT data FROM tasks WHERE {0} ORDER BY {1} {2}, id'.format(where, sort, order)
+        if page is not None:
+            sql += ' LIMIT ? OFFSET ?'
+            params = params + [per_page, (page - 1) * per_page]
+        return [json.loads(row[0]) for row in self.db.execute(sql, params)]
+
+    def count(self, criteria=None):
+        """Number of stored tasks matching criteria"""
+        where, params = self._where(criteria or {})
+        return self.db.execute('SELECT COUNT(*) FROM tasks WHERE ' + where, params).fetchone()[0]
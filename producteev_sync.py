@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+
+Copyright © 2014 François Bianco <francois.bianco@skadi.ch>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+See COPYING file for the full license.
+
+"""
+
+import calendar
+import os
+import re
+import time
+
+import simplejson as json
+
+
+def timestamp(value):
+    """Convert a Producteev date (ISO 8601 string like
+       2014-09-03T12:00:00+0200) or a number to a UNIX timestamp
+    """
+    if value is None or isinstance(value, (int, long, float)):
+        return value
+    m = re.match(r'(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(?:\.\d+)?(Z|[+-]\d\d:?\d\d)?$', value)
+    if m is None:
+        raise ValueError, "Unknown date format: %s" % value
+    t = calendar.timegm(time.strptime(m.group(1), '%Y-%m-%dT%H:%M:%S'))
+    tz = (m.group(2) or 'Z').replace(':', '')
+    if tz != 'Z':
+        offset = int(tz[1:3]) * 3600 + int(tz[3:5]) * 60
+        t -= offset if tz[0] == '+' else -offset
+    return t
+
+
+def _write_json(path, obj):
+    """Atomically replace the file at path by the JSON dump of obj"""
+    with open(path + '.tmp', 'wb') as f:
+        json.dump(obj, f)
+    os.rename(path + '.tmp', path)
+
+
+class _JsonLog():
+    """JSON file at path, and the log of its changes since it was written
+       (log_path, by default path + '.log', one JSON value per line)
+
+       load() reads the file, replay() the changes logged, append() logs
+       new ones and compact() writes the file again with the changes
+       merged and empties the log. Call compact() once full(): when the
+       log is larger than the file and than min_size bytes, so that the
+       cost of the writes stays proportional to the changes.
+    """
+
+    def __init__(self, path, log_path=None, min_size=65536):
+        self.path = path
+        self.log_path = log_path or path + '.log'
+        self.min_size = min_size
+        self.size = 0 # bytes logged
+        self.saved = os.path.getsize(path) if os.path.exists(path) else 0
+
+    def load(self, default):
+        """Content of the JSON file, default if it does not exist"""
+        try:
+            with open(self.path, 'rb') as f:
+                return json.load(f)
+        except IOError:
+            return default
+
+    def replay(self):
+        """Generator of the values logged, in their order"""
+        self.size = 0
+        try:
+            f = open(self.log_path, 'rb')
+        except IOError:
+            return
+        cut = False
+        try:
+            for line in f:
+                try:
+                    value = json.loads(line)
+                except ValueError:
+                    value = None
+                if value is None or not line.endswith('\n'): # last line cut by a crash
+                    cut = True
+                    break
+                self.size += len(line)
+                yield value
+        finally:
+            f.close()
+        if cut: # else the next values would be appended after it
+            with open(self.log_path, 'r+b') as f:
+                f.truncate(self.size)
+
+    def append(self, values):
+        lines = ''.join(json.dumps(value) + '\n' for value in values)
+        with open(self.log_path, 'ab') as f:
+            f.write(lines)
+        self.size += len(lines)
+
+    def full(self):
+        return self.size > max(self.saved, self.min_size)
+
+    def compact(self, obj):
+        """Replace the JSON file by obj and empty the log"""
+        _write_json(self.path, obj)
+        try:
+            os.remove(self.log_path)
+        except OSError:
+            pass
+        self.saved = os.path.getsize(self.path)
+        self.size = 0
+
+
+class JsonTaskStore():
+    """Local store of tasks by id, saved as a JSON file
+
+       commit() appends the changes since the previous commit to a log
+       file (path + '.log', one JSON change per line), which is merged
+       into the JSON file once larger than it, see compact().
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.changes = []
+        self.log = _JsonLog(path)
+        self.tasks = self.log.load({})
+        for operation, value in self.log.replay():
+            if 'put' == operation:
+                self.tasks[value['id']] = value
+            else:
+                self.tasks.pop(value, None)
+
+    def put(self, task):
+        self.tasks[task['id']] = task
+        self.changes.append(('put', task))
+
+    def delete(self, task_id):
+        if self.tasks.pop(task_id, None) is not None:
+            self.changes.append(('delete', task_id))
+
+    def get(self, task_id):
+        return self.tasks.get(task_id)
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def commit(self):
+        if self.log.full():
+            self.compact()
+            return
+        self.log.append(self.changes)
+        self.changes = []
+
+    def compact(self):
+        """Write all the tasks to the JSON file and empty the log"""
+        self.log.compact(self.tasks)
+        self.changes = []
+
+
+class TaskSync():
+    """Incremental synchronisation of the tasks into a local store
+
+       Each sync() only requests the tasks updated since the previous run,
+       using the updated_at search criteria. The high-water mark (the
+       latest updated_at seen, and the ids of the tasks seen with it) is
+       kept per scope (the criteria) in the state file. Deleted tasks are
+       requested too (include_deleted) and removed from the store.
+
+       The tasks are received by increasing updated_at. Rather than
+       requesting the next page, which would skip tasks when one is
+       updated during the run, the search is started again from the mark
+       after each page (keyset paging). The store and the mark are
+       checkpointed every checkpoint_every tasks and an interrupted run
+       restarts from the last checkpoint.
+
+       overlap is the number of seconds requested again before the mark
+       by a new run, to not miss tasks updated while the previous run was
+       going on. The pages of this window are requested one after the
+       other, the search only restarts from the mark once a page reached
+       it.
+
+       Example:
+           sync = TaskSync(Producteev(), JsonTaskStore('tasks.json'))
+           sync.sync({"projects":[project_id]})
+    """
+
+    def __init__(self, api, store, state_path='producteev_sync.json', overlap=60, checkpoint_every=1000):
+        self.api = api
+        self.store = store
+        self.state_path = state_path
+        self.overlap = overlap
+        self.checkpoint_every = checkpoint_every
+        try:
+            with open(state_path, 'rb') as f:
+                self.state = json.load(f)
+        except IOError:
+            self.state = {}
+
+    def scope(self, criteria):
+        """Key of the state entry for the criteria, except updated_at"""
+        scope = {'networks': [], 'projects': []}
+        for name, value in (criteria or {}).items():
+            if 'updated_at' != name:
+                scope[name] = sorted(value) if isinstance(value, list) else value
+        return json.dumps(scope, sort_keys=True)
+
+    def _checkpoint(self, key, mark, seen):
+        self.store.commit()
+        if mark is not None:
+            self.state[key] = {'mark': mark, 'seen': sorted(seen)}
+            _write_json(self.state_path, self.state)
+
+    def sync(self, criteria=None, per_page=50):
+        """Fetch the tasks matching criteria updated since the last run,
+           merge them in the store and return the number of tasks updated
+           and deleted as a dictionary.
+
+           criteria are the same as for Producteev.search_tasks(), except
+           updated_at which is set from the high-water mark.
+        """
+        key = self.scope(criteria)
+        state = self.state.get(key)
+        if isinstance(state, dict):
+            mark, seen = state['mark'], set(state['seen'])
+        else: # mark alone, before the ids were kept
+            mark, seen = state, set()
+        since = None if mark is None else max(0, mark - self.overlap)
+        filters = {'alias': 'all', 'sort': 'updated_at', 'order': 'asc',
+                   'include_deleted': 'true'}
+
+        stats = {'updated': 0, 'deleted': 0}
+        count = 0
+        page = 1
+        while True:
+            page_criteria = dict(criteria or {})
+            if since is not None:
+                page_criteria['updated_at'] = {'from': since}
+            tasks = (self.api.search_tasks(page_criteria, filters, page, per_page) or {}).get('tasks') or []
+            for task in tasks:
+                updated_at = timestamp(task.get('updated_at'))
+                if updated_at is not None and updated_at == mark and task['id'] in seen:
+                    continue
+                if task.get('deleted_at') or task.get('deleted'):
+                    self.store.delete(task['id'])
+                    stats['deleted'] += 1
+                else:
+                    self.store.put(task)
+                    stats['updated'] += 1
+                if updated_at is not None and (mark is None or updated_at > mark):
+                    mark = updated_at
+                    seen = set()
+                if updated_at is not None and updated_at == mark:
+                    seen.add(task['id'])
+                count += 1
+                if count % self.checkpoint_every == 0:
+                    self._checkpoint(key, mark, seen)
+
+            if len(tasks) < per_page:
+                break
+            last = timestamp(tasks[-1].get('updated_at'))
+            if mark is not None and mark != since and last is not None and last >= mark:
+                since = mark
+                page = 1
+            else: # a whole page of tasks updated at the mark, or still before it in the overlap
+                page += 1
+
+        self._checkpoint(key, mark, seen)
+        return stats
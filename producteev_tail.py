@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+
+Copyright © 2014 François Bianco <francois.bianco@skadi.ch>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+See COPYING file for the full license.
+
+"""
+
+import heapq
+import time
+from itertools import islice
+
+from producteev import bounded_map
+from producteev_sync import _JsonLog
+
+
+class ActivityTailer():
+    """Follow the activities of many projects and yield the new ones
+
+       The activities are listed newest first, so each poll of a project
+       only reads its activities until one already seen, page by page
+       (at most max_pages). The ids of the last seen_size activities of
+       each project are kept in the state file, so the events are not
+       emitted twice, even after a restart. The first poll of a project
+       only records its current activities, unless backfill is True.
+
+       Each poll appends the state of the polled projects to a log file
+       (state_path + '.log'), merged into the state file once larger
+       than it.
+
+       Each project has its own polling interval, between min_interval and
+       max_interval seconds: halved when the poll found new activities,
+       else increased by half. Quiet projects are thus polled rarely and
+       busy ones often. The due projects are polled by workers threads.
+
+       Example:
+           tailer = ActivityTailer(Producteev(), project_ids)
+           for project_id, activity in tailer.events():
+               print project_id, activity['id']
+    """
+
+    def __init__(self, api, project_ids, state_path='producteev_tail.json', min_interval=30,
+                 max_interval=900, per_page=50, max_pages=10, seen_size=20, workers=4, backfill=False):
+        self.api = api
+        self.state_path = state_path
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.per_page = per_page
+        self.max_pages = max_pages
+        self.seen_size = seen_size
+        self.workers = workers
+        self.backfill = backfill
+        self.errors = {}
+        self.log = _JsonLog(state_path)
+        self.state = self.log.load({})
+        for states in self.log.replay():
+            self.state.update(states)
+        self.schedule = []
+        self.watched = set()
+        for project_id in project_ids:
+            self.watch(project_id)
+
+    def _save(self, project_ids):
+        """Append the state of the projects to the log, or merge it into
+           the state file once the log is too long
+        """
+        if self.log.full():
+            self.log.compact(self.state)
+        else:
+            self.log.append([dict((project_id, self.state[project_id]) for project_id in project_ids)])
+
+    def watch(self, project_id):
+        """Add a project to poll, at once if it was never polled"""
+        if project_id in self.watched:
+            return
+        self.watched.add(project_id)
+        state = self.state.setdefault(project_id, {'seen': None, 'interval': self.min_interval, 'polled_at': 0})
+        heapq.heappush(self.schedule, (state['polled_at'] + state['interval'], project_id))
+
+    def _fetch(self, project_id):
+        """New activities of the project, oldest first"""
+        seen = self.state[project_id]['seen']
+        known = set(seen or [])
+        activities = self.api.iter_project_activities(project_id, self.per_page)
+        if seen is None and not self.backfill:
+            activities = islice(activities, self.per_page)
+        new = []
+        for activity in islice(activities, self.per_page * self.max_pages):
+            if activity['id'] in known:
+                break
+            new.append(activity)
+        new.reverse()
+        return new
+
+    def _update(self, project_id, new, error, now):
+        state = self.state[project_id]
+        first = state['seen'] is None
+        if error is not None:
+            self.errors[project_id] = error
+            state['interval'] = min(2 * state['interval'], self.max_interval)
+            new = []
+        else:
+            self.errors.pop(project_id, None)
+            if new and not first:
+                state['interval'] = max(state['interval'] / 2.0, self.min_interval)
+            elif not new:
+                state['interval'] = min(state['interval'] * 1.5, self.max_interval)
+            state['seen'] = ((state['seen'] or []) + [a['id'] for a in new])[-self.seen_size:]
+        state['polled_at'] = now
+        heapq.heappush(self.schedule, (now + state['interval'], project_id))
+        if first and not self.backfill:
+            return []
+        return new
+
+    def poll(self):
+        """Poll the due projects and return their new activities as a list
+           of (project_id, activity), oldest first for each project
+        """
+        now = time.time()
+        due = []
+        while self.schedule and self.schedule[0][0] <= now:
+            due.append(heapq.heappop(self.schedule)[1])
+        if not due:
+            return []
+        events = []
+        for project_id, new, exc_info in bounded_map(self._fetch, due, min(self.workers, len(due))):
+            error = exc_info[1] if exc_info is not None else None
+            events.extend((project_id, activity) for activity in self._update(project_id, new, error, now))
+        self._save(due)
+        return events
+
+    def next_poll(self):
+        """Seconds until the next project is due"""
+        if not self.schedule:
+            return None
+        return max(0, self.schedule[0][0] - time.time())
+
+    def events(self):
+        """Endless generator of the new activities as (project_id, activity)"""
+        while self.schedule:
+            for event in self.poll():
+                yield event
+            time.sleep(self.next_poll() or 0)
+
+    def run(self, callback):
+        """Call callback(project_id, activity) for each new activity"""
+        for project_id, activity in self.events():
+            callback(project_id, activity)
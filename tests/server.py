@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+
+Copyright © 2014 François Bianco <francois.bianco@skadi.ch>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+See COPYING file for the full license.
+
+Scriptable HTTP/1.1 server for the tests.
+
+"""
+
+import socket
+import threading
+from urlparse import urlparse, parse_qsl
+
+import simplejson as json
+
+
+class Request(object):
+    """Request received by the Server"""
+
+    def __init__(self, method, path, headers, body):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+        u = urlparse(path)
+        self.uri = u.path
+        self.query = dict(parse_qsl(u.query, True))
+
+    def json(self):
+        return json.loads(self.body) if self.body else None
+
+
+def response(obj=None, status=200, headers=None, close=False):
+    """JSON response as returned by a handler"""
+    all_headers = {'Content-Type': 'application/json'}
+    all_headers.update(headers or {})
+    return status, all_headers, '' if obj is None else json.dumps(obj), close
+
+
+class Server(object):
+    """Threaded HTTP/1.1 server on localhost with kept alive connections
+
+       handler(request) is called for every Request and returns (status,
+       headers, body, close), see response(). If close is True, the
+       connection is closed after the response without telling the
+       client, like a server dropping an idle kept alive connection.
+       A Content-Length in headers is sent instead of the body length,
+       with close it cuts the response.
+
+       The requests received are appended to requests.
+    """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = []
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(('127.0.0.1', 0))
+        self.socket.listen(16)
+        self.uri = 'http://127.0.0.1:{0}'.format(self.socket.getsockname()[1])
+        self.thread = threading.Thread(target=self._accept)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, address = self.socket.accept()
+            except socket.error:
+                return
+            with self.lock:
+                self.connections += 1
+            thread = threading.Thread(target=self._serve, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def _serve(self, conn):
+        conn.settimeout(5)
+        f = conn.makefile('rb')
+        try:
+            while True:
+                line = f.readline()
+                if not line.strip():
+                    return
+                method, path, version = line.split()
+                headers = {}
+                while True:
+                    line = f.readline()
+                    if not line.strip():
+                        break
+                    name, value = line.split(':', 1)
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length') or 0)
+                body = f.read(length) if length else ''
+                request = Request(method, path, headers, body)
+                with self.lock:
+                    self.requests.append(request)
+                status, response_headers, response_body, close = self.handler(request)
+                lines = ['HTTP/1.1 {0} Status'.format(status)]
+                if 'content-length' not in [k.lower() for k in response_headers]:
+                    lines.append('Content-Length: {0}'.format(len(response_body)))
+                lines.extend('{0}: {1}'.format(k, v) for k, v in response_headers.items())
+                conn.sendall('\r\n'.join(lines) + '\r\n\r\n' + response_body)
+                if close:
+                    return
+        except (socket.error, ValueError):
+            return
+        finally:
+            f.close()
+            conn.close()
+
+    def close(self):
+        self.socket.close()
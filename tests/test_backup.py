@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from producteev import Producteev, ProducteevError
+from producteev_backup import AttachmentBackup
+from tests.server import Server
+
+DATA = ''.join(chr(i % 256) for i in range(1000))
+
+
+class AttachmentBackupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cut = None
+        self.server = Server(self.handle)
+        self.p = Producteev(api_uri=self.server.uri, access_token='token')
+        self.backup = AttachmentBackup(self.p, self.directory, chunk_size=100)
+        self.file_obj = {'id': 'f1', 'title': 'a.bin', 'url': self.server.uri + '/files/f1'}
+        self.part = self.backup.path(self.file_obj) + '.part'
+
+    def tearDown(self):
+        self.server.close()
+        shutil.rmtree(self.directory)
+
+    def handle(self, request):
+        start = int(request.headers.get('range', 'bytes=0-')[6:-1])
+        if start >= len(DATA):
+            return 416, {'Content-Range': 'bytes */{0}'.format(len(DATA))}, '', False
+        headers = {'Content-Length': str(len(DATA) - start)}
+        if start:
+            headers['Content-Range'] = 'bytes {0}-{1}/{2}'.format(start, len(DATA) - 1, len(DATA))
+        body = DATA[start:self.cut]
+        return 206 if start else 200, headers, body, self.cut is not None
+
+    def write_part(self, data):
+        with open(self.part, 'wb') as f:
+            f.write(data)
+
+    def assertComplete(self):
+        path = self.backup.path(self.file_obj)
+        with open(path, 'rb') as f:
+            self.assertEqual(DATA, f.read())
+        self.assertFalse(os.path.exists(self.part))
+        self.assertTrue(self.backup.done(self.file_obj))
+        self.assertEqual(hashlib.sha1(DATA).hexdigest(), self.backup.manifest['f1']['sha1'])
+
+    def test_resumed(self):
+        self.write_part(DATA[:300])
+
+        self.backup.fetch(self.file_obj)
+
+        self.assertEqual('bytes=300-', self.server.requests[0].headers['range'])
+        self.assertComplete()
+
+    def test_truncated(self):
+        self.cut = 400
+        self.assertRaises(ProducteevError, self.backup.fetch, self.file_obj)
+        self.assertEqual(400, os.path.getsize(self.part))
+        self.assertFalse(self.backup.done(self.file_obj))
+
+        self.cut = None
+        self.backup.fetch(self.file_obj)
+
+        self.assertEqual('bytes=400-', self.server.requests[1].headers['range'])
+        self.assertComplete()
+
+    def test_complete_part(self):
+        self.write_part(DATA)
+
+        self.backup.fetch(self.file_obj)
+
+        self.assertEqual(1, len(self.server.requests))
+        self.assertComplete()
+
+    def test_download_truncated(self):
+        self.cut = 400
+        f = StringIO()
+        self.assertRaises(ProducteevError, self.p.download, self.file_obj['url'], f)
+        self.assertEqual(DATA[:400], f.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
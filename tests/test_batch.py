@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import socket
+import unittest
+
+from producteev import Producteev, ProducteevBadRequest
+from tests.server import Server, response
+
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = Server(self.handle)
+        self.p = Producteev(api_uri=self.server.uri, access_token='token')
+
+    def tearDown(self):
+        self.server.close()
+
+    def handle(self, request):
+        tasks = (request.json() or {}).get('tasks') or []
+        if any('bad' == task.get('title') for task in tasks):
+            return response({'error': 'Bad title'}, status=400)
+        return response({'tasks': tasks})
+
+    def test_chunks(self):
+        with self.p.batch(2) as batch:
+            for i in range(5):
+                self.p.update_task('t%d' % i, title='good')
+            self.p.delete_task('t9')
+
+        self.assertEqual(4, len(self.server.requests))
+        self.assertEqual(6, len(batch.results))
+        self.assertEqual([], batch.errors)
+
+    def test_chunk_error(self):
+        with self.p.batch(2) as batch:
+            self.p.update_task('t1', title='bad')
+            self.p.update_task('t2', title='good')
+            self.p.update_task('t3', title='good')
+
+        self.assertEqual(['t1', 't2'], [r[2]['id'] for r in batch.errors])
+        self.assertIsInstance(batch.errors[0][4], ProducteevBadRequest)
+
+    def test_connection_error(self):
+        self.server.close()
+        self.p.api_uri = 'http://127.0.0.1:1'
+        with self.p.batch(2) as batch:
+            self.p.update_task('t1', title='good')
+            self.p.delete_task('t2')
+
+        self.assertEqual(2, len(batch.errors))
+        self.assertIsInstance(batch.errors[0][4], socket.error)
+
+    def test_queued_calls_sent_first(self):
+        with self.p.batch(2) as batch:
+            self.p.add_task_label('t1', 'l1')
+            self.p.add_task_label('t2', 'l1')
+            self.p.add_task_label('t3', 'l1')
+            self.p.update_task('t2', title='good')
+            self.p.delete_task_label('t1', 'l1')
+
+        self.assertEqual(['PUT', 'PUT', 'DELETE', 'POST'], [r.method for r in self.server.requests])
+        self.assertEqual('/api/tasks/t1/labels/l1', self.server.requests[2].uri)
+        self.assertEqual(4, len(batch.results))
+
+
+if __name__ == '__main__':
+    unittest.main()
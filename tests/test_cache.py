@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from producteev import Producteev, ResponseCache
+from tests.server import Server, response
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.version = 0
+        self.server = Server(self.handle)
+        self.cache = ResponseCache([(r'^/api/projects/[^/?]+$', 60), (r'^/api/users/me$', 0)])
+        self.p = Producteev(api_uri=self.server.uri, access_token='token', cache=self.cache)
+        self.hits = []
+        self.p.add_hook('cache_hit', lambda info: self.hits.append(info['uri']))
+
+    def tearDown(self):
+        self.server.close()
+
+    def handle(self, request):
+        if 'GET' != request.method:
+            self.version += 1
+            return response({})
+        etag = '"{0}"'.format(self.version)
+        if etag == request.headers.get('if-none-match'):
+            return 304, {'ETag': etag}, '', False
+        return response({'path': request.uri, 'version': self.version}, headers={'ETag': etag})
+
+    def test_fresh_hit(self):
+        first = self.p.get_project('p1')
+        second = self.p.get_project('p1')
+
+        self.assertEqual(first, second)
+        self.assertEqual(1, len(self.server.requests))
+        self.assertEqual(['/api/projects/p1'], self.hits)
+
+    def test_not_cached(self):
+        self.p.get_task('t1')
+        self.p.get_task('t1')
+
+        self.assertEqual(2, len(self.server.requests))
+        self.assertEqual([], self.hits)
+
+    def test_revalidated(self):
+        first = self.p.get_current_user()
+        second = self.p.get_current_user()
+
+        self.assertEqual(first, second)
+        self.assertEqual('"0"', self.server.requests[1].headers['if-none-match'])
+        self.assertEqual(['/api/users/me'], self.hits)
+
+    def test_revalidated_changed(self):
+        self.p.get_current_user()
+        self.version = 1
+        self.assertEqual(1, self.p.get_current_user()['version'])
+        self.assertEqual([], self.hits)
+
+    def test_invalidated_by_change(self):
+        self.p.get_project('p1')
+        self.p.get_project('p2')
+        self.p.PUT('/api/projects/p1', {'project': {'title': 'New'}})
+
+        self.assertEqual(1, self.p.get_project('p1')['version'])
+        self.assertEqual(0, self.p.get_project('p2')['version'])
+
+    def test_users_not_shared(self):
+        bob = Producteev(api_uri=self.server.uri, access_token='bob', cache=self.cache)
+        self.p.get_project('p1')
+        bob.get_project('p1')
+
+        self.assertEqual(2, len(self.server.requests))
+        self.assertEqual('Bearer bob', self.server.requests[1].headers['authorization'])
+        self.assertEqual([], self.hits)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from producteev import Producteev
+from producteev_outbox import Outbox
+from tests.server import Server, response
+
+
+class OutboxTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.server = Server(self.handle)
+        self.p = Producteev(api_uri=self.server.uri, access_token='token')
+        self.outbox = Outbox(self.p, os.path.join(self.directory, 'outbox.db'))
+        self.status = 400
+
+    def tearDown(self):
+        self.outbox.close()
+        self.server.close()
+        shutil.rmtree(self.directory)
+
+    def handle(self, request):
+        body = request.json() or {}
+        tasks = body.get('tasks') or [body.get('task') or {}]
+        if any('bad' == task.get('title') for task in tasks):
+            return response({'error': 'Bad title'}, status=self.status)
+        return response({'tasks': tasks})
+
+    def test_bad_mutation_isolated(self):
+        for i in range(5):
+            self.outbox.update_task('t%d' % i, title='good')
+        self.outbox.update_task('t5', title='bad')
+
+        stats = self.outbox.flush()
+
+        self.assertEqual({'sent': 5, 'coalesced': 0, 'failed': 1, 'retry': 0}, stats)
+        failed = self.outbox.failed()
+        self.assertEqual(1, len(failed))
+        self.assertEqual({'task_id': 't5', 'title': 'bad'}, failed[0][3])
+        self.assertEqual(0, len(self.outbox))
+
+    def test_next_mutations_sent_after_failure(self):
+        self.outbox.update_task('t1', title='bad')
+        self.outbox.delete_task('t1')
+        self.outbox.update_task('t2', title='good')
+
+        stats = self.outbox.flush()
+
+        self.assertEqual(2, stats['sent'])
+        self.assertEqual(1, stats['failed'])
+        self.assertEqual('DELETE', self.server.requests[-1].method)
+
+    def test_temporary_error_kept(self):
+        self.status = 503
+        self.outbox.update_task('t1', title='bad')
+        self.outbox.update_task('t2', title='good')
+
+        stats = self.outbox.flush()
+
+        self.assertEqual(0, stats['sent'])
+        self.assertEqual(2, stats['retry'])
+        self.assertEqual(2, len(self.outbox))
+        self.assertEqual([], self.outbox.failed())
+
+    def test_updates_coalesced(self):
+        self.outbox.update_task('t1', title='a')
+        self.outbox.update_task(task_id='t1', title='b', status=2)
+        self.outbox.update_task('t2', title='good')
+
+        stats = self.outbox.flush()
+
+        self.assertEqual({'sent': 2, 'coalesced': 1, 'failed': 0, 'retry': 0}, stats)
+        tasks = self.server.requests[0].json()['tasks']
+        self.assertEqual([{'id': 't1', 'title': 'b', 'status': 2}, {'id': 't2', 'title': 'good'}], tasks)
+
+    def test_invalid_mutation_permanent(self):
+        db = sqlite3.connect(self.outbox.path)
+        db.execute('INSERT INTO outbox (resource, operation, args) VALUES (?, ?, ?)',
+                   ('task:t1', 'update_task', '[["t1"], {"task_id": "t1"}]'))
+        db.commit()
+        db.close()
+        self.outbox.update_task('t1', title='good')
+        self.outbox.update_task('t2', title='good')
+
+        stats = self.outbox.flush()
+
+        self.assertEqual({'sent': 2, 'coalesced': 0, 'failed': 1, 'retry': 0}, stats)
+        self.assertIn('TypeError', self.outbox.failed()[0][4])
+
+
+if __name__ == '__main__':
+    unittest.main()
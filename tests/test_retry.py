@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from producteev import Producteev, ProducteevServiceUnavailable, RetryPolicy
+from tests.server import Server, response
+
+
+class RetryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.statuses = []
+        self.retry_after = '0'
+        self.server = Server(self.handle)
+        self.p = Producteev(api_uri=self.server.uri, access_token='token', retry=RetryPolicy(backoff=0))
+
+    def tearDown(self):
+        self.server.close()
+
+    def handle(self, request):
+        status = self.statuses.pop(0) if self.statuses else 200
+        return response({'status': status}, status=status, headers={'Retry-After': self.retry_after})
+
+    def test_retried(self):
+        self.statuses = [503, 503]
+        self.assertEqual({'status': 200}, self.p.get_task('t1'))
+        self.assertEqual(3, len(self.server.requests))
+
+    def test_retry_after_above_max(self):
+        self.statuses = [503]
+        self.retry_after = '3600'
+        self.assertRaises(ProducteevServiceUnavailable, self.p.get_task, 't1')
+        self.assertEqual(1, len(self.server.requests))
+
+    def test_retry_after_above_max_backoff(self):
+        self.p.retry = RetryPolicy(max_backoff=1)
+        self.assertEqual(120, self.p.retry.delay(0, {'retry-after': '120'}))
+
+
+if __name__ == '__main__':
+    unittest.main()
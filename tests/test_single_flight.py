@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+import unittest
+
+from producteev import Producteev, ResponseCache, SingleFlight
+from tests.server import Server, response
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def setUp(self):
+        self.version = 0
+        self.delay = 0.3
+        self.server = Server(self.handle)
+        self.flights = SingleFlight()
+
+    def tearDown(self):
+        self.server.close()
+
+    def handle(self, request):
+        if 'PUT' == request.method:
+            self.version += 1
+            return response({'version': self.version})
+        version = self.version
+        time.sleep(self.delay)
+        if '"{0}"'.format(version) == request.headers.get('if-none-match'):
+            return 304, {}, '', False
+        return response({'version': version, 'authorization': request.headers.get('authorization')},
+                        headers={'ETag': '"{0}"'.format(version)})
+
+    def api(self, token='token', **kwargs):
+        return Producteev(api_uri=self.server.uri, access_token=token, single_flight=self.flights, **kwargs)
+
+    def concurrently(self, *calls):
+        results = [None] * len(calls)
+        def run(i):
+            try:
+                results[i] = calls[i]()
+            except Exception, e:
+                results[i] = e
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(len(calls))]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.05)
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_identical_requests_shared(self):
+        p = self.api()
+        results = self.concurrently(p.get_current_user, p.get_current_user, p.get_current_user)
+
+        self.assertEqual([results[0]] * 3, results)
+        self.assertEqual(1, len(self.server.requests))
+        self.assertEqual({'calls': 1, 'coalesced': 2}, self.flights.stats())
+
+    def test_users_not_shared(self):
+        alice, bob = self.api('alice'), self.api('bob')
+        results = self.concurrently(alice.get_current_user, bob.get_current_user)
+
+        self.assertEqual(['Bearer alice', 'Bearer bob'], [r['authorization'] for r in results])
+        self.assertEqual(2, len(self.server.requests))
+
+    def test_conditional_request_not_shared(self):
+        cache = ResponseCache(ttls=[(r'^/api/users/me$', 0)])
+        cached, plain = self.api(cache=cache), self.api()
+        self.delay = 0
+        cached.get_current_user()
+        self.delay = 0.3
+
+        results = self.concurrently(cached.get_current_user, plain.get_current_user)
+
+        self.assertEqual([{'version': 0, 'authorization': 'Bearer token'}] * 2, results)
+        self.assertEqual('"0"', self.server.requests[1].headers.get('if-none-match'))
+        self.assertNotIn('if-none-match', self.server.requests[2].headers)
+
+    def test_read_your_writes(self):
+        p = self.api()
+        def write_then_read():
+            p.PUT('/api/users/me', {'user': {}})
+            return p.get_current_user()
+
+        before, after = self.concurrently(p.get_current_user, write_then_read)
+
+        self.assertEqual(0, before['version'])
+        self.assertEqual(1, after['version'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from producteev import Producteev
+from producteev_sync import JsonTaskStore, TaskSync, timestamp
+from tests.server import Server, response
+
+
+class SearchHandler(object):
+    """Task search sorted by updated_at, with offset pagination"""
+
+    def __init__(self, count):
+        self.tasks = dict(('t%03d' % i, {'id': 't%03d' % i, 'updated_at': 1400000000 + i})
+                          for i in range(count))
+        self.searches = 0
+        self.on_search = None
+
+    def __call__(self, request):
+        if self.on_search is not None:
+            self.on_search(self.searches)
+        self.searches += 1
+        criteria = request.json() or {}
+        since = (criteria.get('updated_at') or {}).get('from')
+        tasks = sorted(self.tasks.values(), key=lambda task: (task['updated_at'], task['id']))
+        if since is not None:
+            tasks = [task for task in tasks if timestamp(task['updated_at']) >= since]
+        page, per_page = int(request.query['page']), int(request.query['per_page'])
+        return response({'tasks': tasks[(page - 1) * per_page:page * per_page],
+                         'total_hits': len(tasks)})
+
+
+class TaskSyncTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.handler = SearchHandler(95)
+        self.server = Server(self.handler)
+        self.p = Producteev(api_uri=self.server.uri, access_token='token')
+        self.store = JsonTaskStore(os.path.join(self.directory, 'tasks.json'))
+
+    def tearDown(self):
+        self.server.close()
+        shutil.rmtree(self.directory)
+
+    def sync(self, criteria=None):
+        sync = TaskSync(self.p, self.store, os.path.join(self.directory, 'state.json'), overlap=0)
+        return sync.sync(criteria, per_page=10)
+
+    def test_task_updated_during_sync(self):
+        def update(searches):
+            if 2 == searches:
+                # Moves to the end, an offset paging would skip a task
+                self.handler.tasks['t003']['updated_at'] = 1500000000
+        self.handler.on_search = update
+
+        self.sync()
+
+        self.assertEqual(sorted(self.handler.tasks), sorted(self.store.tasks))
+        self.assertEqual(1500000000, self.store.get('t003')['updated_at'])
+
+    def test_incremental(self):
+        self.assertEqual(95, self.sync()['updated'])
+        self.handler.tasks['t010']['updated_at'] = 1500000000
+        self.assertEqual({'updated': 1, 'deleted': 0}, self.sync())
+        self.assertEqual({'updated': 0, 'deleted': 0}, self.sync())
+
+    def test_same_updated_at(self):
+        for task in self.handler.tasks.values():
+            task['updated_at'] = 1400000000
+
+        self.assertEqual(95, self.sync()['updated'])
+        self.assertEqual(95, len(self.store))
+        self.assertEqual(0, self.sync()['updated'])
+
+    def test_overlap_larger_than_page(self):
+        self.sync()
+        # Committed late with an updated_at long before the mark
+        self.handler.tasks['late'] = {'id': 'late', 'updated_at': 1400000050}
+        sync = TaskSync(self.p, self.store, os.path.join(self.directory, 'state.json'), overlap=100)
+
+        self.assertEqual(95, sync.sync(per_page=10)['updated'])
+        self.assertIn('late', self.store.tasks)
+
+    def test_scope_of_whole_criteria(self):
+        sync = TaskSync(self.p, self.store, os.path.join(self.directory, 'state.json'))
+        self.assertNotEqual(sync.scope({'projects': ['p1'], 'statuses': [1]}),
+                            sync.scope({'projects': ['p1'], 'statuses': [0]}))
+        self.assertEqual(sync.scope({'projects': ['p2', 'p1']}),
+                         sync.scope({'projects': ['p1', 'p2'], 'updated_at': {'from': 1}}))
+
+
+class JsonTaskStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'tasks.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_log_replayed(self):
+        store = JsonTaskStore(self.path)
+        store.put({'id': 'a', 'title': 'A'})
+        store.put({'id': 'b'})
+        store.commit()
+        store.delete('b')
+        store.put({'id': 'a', 'title': 'B'})
+        store.commit()
+        self.assertFalse(os.path.exists(self.path))
+
+        store = JsonTaskStore(self.path)
+        self.assertEqual({'a': {'id': 'a', 'title': 'B'}}, store.tasks)
+
+    def test_line_cut_by_crash(self):
+        store = JsonTaskStore(self.path)
+        store.put({'id': 'a'})
+        store.commit()
+        with open(self.path + '.log', 'ab') as f:
+            f.write('["put", {"id"')
+
+        store = JsonTaskStore(self.path)
+        store.put({'id': 'b'})
+        store.commit()
+
+        self.assertEqual(['a', 'b'], sorted(JsonTaskStore(self.path).tasks))
+
+    def test_compact(self):
+        store = JsonTaskStore(self.path)
+        for i in range(600):
+            store.put({'id': str(i), 'title': 'x' * 100})
+        store.commit()
+        self.assertFalse(os.path.exists(self.path))
+        for i in range(600):
+            store.put({'id': str(i), 'title': 'updated'})
+        store.commit()
+        self.assertTrue(os.path.exists(self.path))
+        self.assertFalse(os.path.exists(self.path + '.log'))
+        self.assertEqual(600, len(JsonTaskStore(self.path)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import socket
+import tempfile
+import time
+import unittest
+
+from producteev import HttpPool, Producteev, RetryPolicy
+from tests.server import Server, response
+
+
+class UploadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = Server(self.handle)
+        self.p = Producteev(api_uri=self.server.uri, access_token='token')
+        fd, self.path = tempfile.mkstemp()
+        self.content = os.urandom(200000)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(self.content)
+
+    def tearDown(self):
+        self.server.close()
+        os.remove(self.path)
+
+    def handle(self, request):
+        if '/api/upload/files' == request.uri:
+            return response({'file': {'id': 'f1', 'size': len(request.body)}})
+        # Drop the kept alive connection after the response
+        return response({'user': {'id': 'u1'}}, close=True)
+
+    def test_upload_after_dropped_connection(self):
+        self.p.get_current_user()
+        result = self.p.upload_file(self.path)
+
+        upload = self.server.requests[-1]
+        self.assertEqual('/api/upload/files', upload.uri)
+        self.assertEqual(int(upload.headers['content-length']), len(upload.body))
+        self.assertIn(self.content, upload.body)
+        self.assertEqual(len(upload.body), result['file']['size'])
+
+    def test_upload_retried_from_start(self):
+        self.p.retry = RetryPolicy(backoff=0)
+        statuses = [503, 200]
+        def handle(request):
+            if '/api/upload/files' == request.uri:
+                return response({'file': {'size': len(request.body)}}, status=statuses.pop(0))
+            return response({})
+        self.server.handler = handle
+
+        result = self.p.upload_file(self.path)
+
+        first, second = self.server.requests
+        self.assertEqual(first.body, second.body)
+        self.assertIn(self.content, second.body)
+        self.assertEqual(len(second.body), result['file']['size'])
+
+    def test_upload_timeout_of_pool(self):
+        self.p = Producteev(api_uri=self.server.uri, access_token='token',
+                            transport=HttpPool(max_connections=1, timeout=0.2), retry=None)
+        def handle(request):
+            time.sleep(1)
+            return response({})
+        self.server.handler = handle
+
+        self.assertRaises(socket.timeout, self.p.upload_file, self.path)
+        self.assertEqual(1, len(self.p.transport._idle))
+
+
+if __name__ == '__main__':
+    unittest.main()